@@ -8,6 +8,7 @@
 #     "pandas>=2.0",
 #     "scipy>=1.10",
 #     "matplotlib>=3.7",
+#     "pyarrow>=14",
 # ]
 # ///
 """
@@ -21,24 +22,57 @@ campaign_analytics as analysis_type = 'ona_network'.
 Usage:
     uv run scripts/ona-analysis.py                  # all closed/archived campaigns
     uv run scripts/ona-analysis.py <campaign_id>    # single campaign
+    uv run scripts/ona-analysis.py --pushdown       # aggregate means in Postgres
+    uv run scripts/ona-analysis.py --export-snapshot DIR   # copy vectors to disk
+    uv run scripts/ona-analysis.py --snapshot DIR   # analyse offline from DIR
+    uv run scripts/ona-analysis.py --worker         # stay resident, serve ona_jobs
     python3 scripts/ona-analysis.py <campaign_id>   # fallback without uv
 """
 
 import os
 import sys
+import argparse
 import base64
+import contextlib
+import cProfile
+import hashlib
+import hmac
 import io
+import json
+import random
+import resource
+import signal
+import socket
+import threading
+import time
+import tracemalloc
+import warnings
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from collections import defaultdict
-
-import igraph as ig
+from typing import Any, Callable, Iterator, Protocol
+
+# python-igraph imports matplotlib.pyplot at load when it is installed
+# (~1 s). The image is drawn with matplotlib directly, never through
+# ig.plot, so igraph is loaded without it and only generate_graph_image
+# pays for the import.
+_HIDE_MATPLOTLIB = "matplotlib" not in sys.modules
+if _HIDE_MATPLOTLIB:
+    sys.modules["matplotlib"] = None  # type: ignore[assignment]  # ImportError for igraph
+try:
+    import igraph as ig
+finally:
+    if _HIDE_MATPLOTLIB:
+        del sys.modules["matplotlib"]
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use("Agg")  # non-interactive backend
-import matplotlib.pyplot as plt
-from scipy.spatial.distance import pdist, squareform
-from supabase import create_client, Client
+import scipy.sparse as sp
+import httpx
+from supabase import create_client, Client, PostgrestAPIError
 
 # ---------------------------------------------------------------------------
 # Config
@@ -52,14 +86,95 @@ SUPABASE_KEY = os.environ.get(
     ".eyJpc3MiOiJzdXBhYmFzZS1kZW1vIiwicm9sZSI6InNlcnZpY2Vfcm9sZSIsImV4cCI6MTk4MzgxMjk5Nn0"
     ".EGIM96RAZx35lJzdJsyH-qQwv8Hdp7fsn3W0YpN81IU",
 )
+# Keys the HMAC linking a participant's email to their respondents across
+# campaigns (--longitudinal); without it nobody can rebuild the link from
+# an employee list
+PERSON_KEY_SECRET = os.environ.get("ONA_PERSON_KEY_SECRET", "")
 
 MIN_RESPONDENTS = 10
+FINGERPRINT_VERSION = 1  # bump when a code change alters results for the same inputs
+FETCH_BATCH_SIZE = 50  # respondent ids per `responses` request
+FETCH_PAGE_SIZE = 1000  # rows per range page; must not exceed PostgREST max_rows
+FETCH_CONCURRENCY = 8  # batch requests kept in flight at once
+FETCH_RETRIES = 3  # attempts per request before a transient failure is raised
+INSTRUMENT_CACHE_SIZE = 32  # instruments kept in memory, least recently used evicted
+INSTRUMENT_CACHE_TTL = 600  # seconds an instrument is trusted before its stamp is rechecked
+INSTRUMENT_CACHE_FILES = 256  # instrument files kept in the --instrument-cache directory
 ENG_CODE = "ENG"  # excluded from similarity vectors (dependent variable)
-STABILITY_ITERATIONS = 50  # number of Leiden runs for stability analysis
+DENSITY_MIN, DENSITY_MAX = 0.10, 0.30  # target edge density of the similarity graph
+GRAPH_MODE = "auto"  # "dense" | "knn" | "auto" (knn from SPARSE_GRAPH_MIN_NODES)
+SPARSE_GRAPH_MIN_NODES = 5000  # n² similarities stop fitting comfortably here
+KNN_EDGE_BUDGET = 2_000_000  # caps k so the kNN graph stays ~n·k ≤ budget edges
+SIM_KERNEL = "cosine"  # "cosine" | "pearson" | "rbf" (over Euclidean distance)
+SIM_DTYPE = "float64"  # "float32" halves memory and roughly doubles GEMM throughput
+SIM_TILE_BYTES = 8 * 2**20  # similarity rows computed per GEMM tile (~L3-sized)
+SIM_HISTOGRAM_BINS = 2**20  # similarity histogram that settles the dense threshold
+STABILITY_ITERATIONS = 50  # max number of Leiden runs for stability analysis
+STABILITY_SEED = 42  # master seed; per-run seeds derive from it
+STABILITY_WORKERS = os.cpu_count() or 1  # processes running the Leiden ensemble
+BATCH_CONCURRENCY = 1  # campaigns analysed at once when running all of them
+WORKER_POLL_SECONDS = 5.0  # queue poll interval of --worker when idle
+WORKER_HEARTBEAT_SECONDS = 30  # running jobs are stamped this often while their worker lives
+WORKER_STALE_SECONDS = 5 * WORKER_HEARTBEAT_SECONDS  # unstamped this long: worker died, reclaim
+WORKER_MAX_ATTEMPTS = 3  # claims per job; a silent job past this is marked failed
+STABILITY_CHECK_EVERY = 10  # runs between convergence checks of the NMI estimate
+STABILITY_TOLERANCE = 0.005  # stop once the estimate moves less than this
+LEIDEN_POOL_MIN_EDGES = 20_000  # below this a process pool costs more than it saves
+NMI_DENSE_TABLE_MAX = 2**24  # contingency cells per batch before switching to np.unique
+LEIDEN_WARM_ITERATIONS = 1  # Leiden iterations per run when warm-started from a prior campaign
+WARM_START_MIN_SHARE = 0.3  # returning respondents needed to warm-start (longitudinal mode)
+LONGITUDINAL_LOOKBACK = 5  # earlier campaigns of the organisation searched for a prior result
+SWEEP_RUNS = 10  # seeded Leiden runs per resolution level in the sweep
+SWEEP_OBJECTIVE = "modularity"  # "modularity" (γ) or "cpm" (multiples of weighted density)
+NULL_MODEL = "permute"  # "permute" (dimensions shuffled) or "rewire" (degree-preserving swaps)
+NULL_REWIRE_TRIALS = 3  # edge-swap attempts per edge when rewiring a null graph
+NULL_LEIDEN_RUNS = 3  # Leiden runs per null graph; its best modularity is kept
+NULL_ALPHA = 0.05  # p-value above which the narrative calls the structure not significant
+BOOTSTRAP_CONFIDENCE = 0.95  # level of the respondent-bootstrap percentile intervals
+BOOTSTRAP_BATCH = 50  # replicates aggregated per NumPy batch (and per worker task)
+CONSENSUS_THRESHOLD = 0.5  # co-association needed for a consensus-graph edge
+CENTRALITY_MODE = "auto"  # "exact", "approx" (sampled sources) or "auto" (by size)
+APPROX_BETWEENNESS_MIN_NODES = 2000  # auto mode samples betweenness sources from here
+BETWEENNESS_SAMPLES = 256  # sampled source vertices in approx mode
+LAYOUT_FR_MAX_NODES = 1000  # full Fruchterman-Reingold up to here, grid FR on a backbone above
+LAYOUT_BACKBONE_K = 10  # strongest edges per node kept for large-graph layouts
+LAYOUT_WARM_ITERATIONS = 100  # FR iterations when seeded from stored coordinates
+IMAGE_MAX_EDGES = 20_000  # intra-community edges drawn are sampled down to this
+STAGES = ("longitudinal", "fingerprint", "fetch", "graph", "communities", "significance",
+          "sweep", "centrality",
+          "metrics", "bootstrap", "layout", "image", "save")  # as timed by process_campaign
+PROFILE_TOP_ALLOCATIONS = 30  # tracemalloc lines written for a profiled stage
 CLUSTER_COLORS = ["#3b82f6", "#ef4444", "#22c55e", "#f59e0b", "#8b5cf6", "#ec4899",
                   "#0ea5e9", "#f97316", "#14b8a6", "#a855f7"]
 
 
+@dataclass
+class ONAOptions:
+    """Per-run analysis switches, built from the CLI in main()."""
+
+    pushdown: bool = False
+    graph_mode: str = GRAPH_MODE
+    kernel: str = SIM_KERNEL
+    dtype: str = SIM_DTYPE
+    stability_iterations: int = STABILITY_ITERATIONS
+    seed: int = STABILITY_SEED
+    workers: int = STABILITY_WORKERS
+    centrality: str = CENTRALITY_MODE
+    betweenness_samples: int = BETWEENNESS_SAMPLES
+    force: bool = False
+    instrument_cache: str | None = None
+    snapshot: str | None = None  # read/write a local snapshot instead of Supabase
+    log_json: bool = False  # one JSON line per stage on stderr
+    profile_stage: str | None = None  # cProfile + tracemalloc this stage
+    profile_dir: str = "."
+    longitudinal: bool = False  # warm-start from the organisation's previous campaign
+    resolutions: tuple[float, ...] = ()  # resolution sweep levels; empty = no sweep
+    resolution_objective: str = SWEEP_OBJECTIVE
+    null_models: int = 0  # null graphs for the modularity significance test; 0 = off
+    null_model: str = NULL_MODEL
+    bootstrap: int = 0  # respondent-bootstrap replicates; 0 = no intervals
+
+
 def get_supabase() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -67,19 +182,368 @@ def get_supabase() -> Client:
 # ---------------------------------------------------------------------------
 # 1. Fetch campaign data
 # ---------------------------------------------------------------------------
+_TRANSIENT_CODES = {"408", "429", "500", "502", "503", "504"}
+
+
+def _execute(build: Callable[[], Any]) -> Any:
+    """Execute a PostgREST query, retrying transient failures with backoff.
+
+    `build` must return a fresh request builder on every call so a retry
+    never reuses a half-consumed request.
+    """
+    for attempt in range(FETCH_RETRIES):
+        try:
+            return build().execute()
+        except (httpx.TransportError, PostgrestAPIError) as exc:
+            transient = isinstance(exc, httpx.TransportError) or (
+                str(exc.code) in _TRANSIENT_CODES
+            )
+            if not transient or attempt == FETCH_RETRIES - 1:
+                raise
+            time.sleep(0.5 * 2**attempt)
+    raise RuntimeError("unreachable")
+
+
+def _fetch_all(build: Callable[[], Any], order: str = "id") -> list[dict]:
+    """Fetch every row of a query by range pages so max_rows never truncates."""
+    rows: list[dict] = []
+    start = 0
+    while True:
+        page = _execute(
+            lambda: build().order(order).range(start, start + FETCH_PAGE_SIZE - 1)
+        ).data or []
+        rows.extend(page)
+        if len(page) < FETCH_PAGE_SIZE:
+            return rows
+        start += FETCH_PAGE_SIZE
+
+
+def _fetch_responses(sb: Client, resp_ids: list[str]) -> list[dict]:
+    """Fetch all responses, keeping FETCH_CONCURRENCY batches in flight.
+
+    Threads share the client's pooled HTTP session; each batch is paged
+    independently and results are concatenated in batch order.
+    """
+    batches = [
+        resp_ids[i : i + FETCH_BATCH_SIZE]
+        for i in range(0, len(resp_ids), FETCH_BATCH_SIZE)
+    ]
+
+    def fetch_batch(batch: list[str]) -> list[dict]:
+        return _fetch_all(
+            lambda: sb.table("responses")
+            .select("respondent_id, item_id, score")
+            .in_("respondent_id", batch)
+        )
+
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as pool:
+        pages = pool.map(fetch_batch, batches)
+        return [r for page in pages for r in page]
+
+
+def _fetch_vectors_rpc(
+    sb: Client, campaign_id: str, dim_codes: list[str]
+) -> tuple[list[dict], np.ndarray]:
+    """Pushdown path: per-respondent dimension means from ona_respondent_vectors.
+
+    The database filters attention checks, reverse-scores and averages, so
+    one row of len(dim_codes) means comes back per completed respondent.
+    Pages are keyset-paginated on respondent_id (p_after/p_limit, migration
+    000024): each call aggregates only its own page of respondents, where
+    range pages would re-run the aggregation over the whole campaign.
+    """
+    rows: list[dict] = []
+    after = None
+    while True:
+        page = _execute(lambda: sb.rpc("ona_respondent_vectors", {
+            "p_campaign_id": campaign_id,
+            "p_codes": dim_codes,
+            "p_after": after,
+            "p_limit": FETCH_PAGE_SIZE,
+        })).data or []
+        rows.extend(page)
+        if len(page) < FETCH_PAGE_SIZE:
+            break
+        after = page[-1]["respondent_id"]
+    resp_list = [
+        {
+            "id": r["respondent_id"],
+            "department": r["department"],
+            "tenure": r["tenure"],
+            "gender": r["gender"],
+        }
+        for r in rows
+    ]
+    means = np.array(
+        [[np.nan if m is None else m for m in r["means"]] for r in rows],
+        dtype=float,
+    ).reshape(len(rows), len(dim_codes))
+    return resp_list, means
+
+
+def _aggregate_responses(
+    responses: list[dict],
+    resp_ids: list[str],
+    dim_codes: list[str],
+    item_map: dict[str, dict],
+) -> np.ndarray:
+    """Per-respondent dimension means as a dense (n, d) matrix, NaN if unanswered.
+
+    Ids are mapped to integer codes, reverse items flipped as an array op and
+    sums/counts reduced with one bincount over respondent × dimension cells.
+    """
+    n, d = len(resp_ids), len(dim_codes)
+    if not responses or not item_map:
+        return np.full((n, d), np.nan)
+
+    code_index = {c: j for j, c in enumerate(dim_codes)}
+    item_ids = pd.Index(list(item_map))
+    item_dim = np.array([code_index[item_map[i]["code"]] for i in item_ids])
+    item_rev = np.array([bool(item_map[i]["reverse"]) for i in item_ids])
+
+    frame = pd.DataFrame.from_records(
+        responses, columns=["respondent_id", "item_id", "score"]
+    )
+    item_idx = item_ids.get_indexer(frame["item_id"])
+    resp_idx = pd.Index(resp_ids).get_indexer(frame["respondent_id"])
+    score = frame["score"].to_numpy(dtype=float, na_value=np.nan)
+
+    keep = (item_idx >= 0) & (resp_idx >= 0) & ~np.isnan(score)
+    item_idx, resp_idx, score = item_idx[keep], resp_idx[keep], score[keep]
+    score = np.where(item_rev[item_idx], 6 - score, score)
+
+    cell = resp_idx * d + item_dim[item_idx]
+    sums = np.bincount(cell, weights=score, minlength=n * d).reshape(n, d)
+    counts = np.bincount(cell, minlength=n * d).reshape(n, d)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _vector_frame(
+    resp_list: list[dict], dim_codes: list[str], means: np.ndarray
+) -> pd.DataFrame | None:
+    """Keep respondents with a mean for every dimension and attach metadata."""
+    complete = ~np.isnan(means).any(axis=1)
+    n_complete = int(complete.sum())
+    if n_complete < MIN_RESPONDENTS:
+        print(f"  Only {n_complete} respondents with complete vectors (min {MIN_RESPONDENTS})")
+        return None
+
+    kept = [r for r, ok in zip(resp_list, complete) if ok]
+    df = pd.DataFrame(means[complete], columns=dim_codes)
+    df["_id"] = [r["id"] for r in kept]
+    df["_dept"] = [r.get("department") or "Sin departamento" for r in kept]
+    df["_tenure"] = [r.get("tenure") or "" for r in kept]
+    df["_gender"] = [r.get("gender") or "" for r in kept]
+    return df
+
+
+def _write_json(path: str, obj: Any) -> None:
+    """Write JSON atomically: concurrent batch workers never see half a file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+@dataclass
+class InstrumentMeta:
+    """Dimension codes and item flags of one instrument, as of `stamp`."""
+
+    instrument_id: str
+    stamp: str | None  # instruments.updated_at (bumped by item edits, migration 000022)
+    dimensions: dict[str, str]  # dimension id -> code
+    items: dict[str, dict]  # item id -> {"code", "reverse", "attention"}
+    checked: float = 0.0  # time.monotonic() of the last stamp check; not persisted
+
+
+class InstrumentCache:
+    """Per-instrument metadata shared by every campaign of a run.
+
+    Entries live in an LRU of INSTRUMENT_CACHE_SIZE instruments and,
+    with `directory`, in one JSON file per instrument so later runs start
+    warm. An entry is trusted for INSTRUMENT_CACHE_TTL seconds; after that
+    (and always for entries read from disk) its stamp is compared with
+    instruments.updated_at and it is refetched if the instrument changed.
+    """
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self._memory: OrderedDict[str, InstrumentMeta] = OrderedDict()
+        self.fetches = 0  # instruments fetched from the database
+
+    def resolve(
+        self, sb: Client, instrument_ids: list[str]
+    ) -> tuple[list[str], dict[str, dict]]:
+        """Merged (dim_codes, item_map) for a campaign's instruments.
+
+        ENG and attention checks are left out, as the similarity vectors use
+        neither; item_map holds {"code", "reverse"} per scored item.
+        """
+        codes: set[str] = set()
+        item_map: dict[str, dict] = {}
+        for meta in self.get(sb, instrument_ids):
+            codes.update(c for c in meta.dimensions.values() if c != ENG_CODE)
+            for item_id, it in meta.items.items():
+                if not it["attention"] and it["code"] != ENG_CODE:
+                    item_map[item_id] = {"code": it["code"], "reverse": it["reverse"]}
+        return sorted(codes), item_map
+
+    def get(self, sb: Client, instrument_ids: list[str]) -> list[InstrumentMeta]:
+        """Metadata of each instrument, checking stamps and fetching as needed."""
+        now = time.monotonic()
+        unchecked = [
+            iid for iid in dict.fromkeys(instrument_ids)
+            if iid not in self._memory or now - self._memory[iid].checked > INSTRUMENT_CACHE_TTL
+        ]
+        found = {iid: self._memory[iid] for iid in instrument_ids if iid in self._memory}
+        if unchecked:
+            # Stamps are read before any refetch: an edit racing the fetch
+            # leaves an older stamp behind and is picked up next time.
+            stamps = self._stamps(sb, unchecked)
+            stale = []
+            for iid in unchecked:
+                meta = found.get(iid) or self._load(iid)
+                if meta is not None and meta.stamp == stamps.get(iid):
+                    meta.checked = now
+                    found[iid] = meta
+                else:
+                    stale.append(iid)
+            if stale:
+                for meta in self._fetch(sb, stale, stamps):
+                    meta.checked = now
+                    found[meta.instrument_id] = meta
+                    self._save(meta)
+        for iid in instrument_ids:
+            if iid in found:
+                self._memory[iid] = found[iid]
+                self._memory.move_to_end(iid)
+        while len(self._memory) > INSTRUMENT_CACHE_SIZE:
+            self._memory.popitem(last=False)
+        return [found[iid] for iid in instrument_ids if iid in found]
+
+    def _stamps(self, sb: Client, instrument_ids: list[str]) -> dict[str, str]:
+        rows = _fetch_all(
+            lambda: sb.table("instruments")
+            .select("id, updated_at")
+            .in_("id", instrument_ids)
+        )
+        return {r["id"]: r["updated_at"] for r in rows}
+
+    def _fetch(
+        self, sb: Client, instrument_ids: list[str], stamps: dict[str, str]
+    ) -> list[InstrumentMeta]:
+        self.fetches += len(instrument_ids)
+        dims = _fetch_all(
+            lambda: sb.table("dimensions")
+            .select("id, code, instrument_id")
+            .in_("instrument_id", instrument_ids)
+        )
+        metas = {
+            iid: InstrumentMeta(iid, stamps.get(iid), {}, {}) for iid in instrument_ids
+        }
+        dim_owner: dict[str, InstrumentMeta] = {}
+        for d in dims:
+            meta = metas[d["instrument_id"]]
+            meta.dimensions[d["id"]] = d["code"]
+            dim_owner[d["id"]] = meta
+        if dim_owner:
+            items = _fetch_all(
+                lambda: sb.table("items")
+                .select("id, dimension_id, is_reverse, is_attention_check")
+                .in_("dimension_id", list(dim_owner))
+            )
+            for it in items:
+                meta = dim_owner[it["dimension_id"]]
+                meta.items[it["id"]] = {
+                    "code": meta.dimensions[it["dimension_id"]],
+                    "reverse": bool(it["is_reverse"]),
+                    "attention": bool(it["is_attention_check"]),
+                }
+        return list(metas.values())
+
+    def _path(self, instrument_id: str) -> str:
+        return os.path.join(self.directory, f"{instrument_id}.json")
+
+    def _load(self, instrument_id: str) -> InstrumentMeta | None:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(instrument_id)) as f:
+                raw = json.load(f)
+            return InstrumentMeta(
+                raw["instrument_id"], raw["stamp"], raw["dimensions"], raw["items"]
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # missing or unreadable: refetch
+
+    def _save(self, meta: InstrumentMeta) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(
+            self._path(meta.instrument_id),
+            {
+                "instrument_id": meta.instrument_id,
+                "stamp": meta.stamp,
+                "dimensions": meta.dimensions,
+                "items": meta.items,
+            },
+        )
+        files = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".json")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in files[: max(0, len(files) - INSTRUMENT_CACHE_FILES)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass  # another worker got there first
+
+
+_instrument_cache: InstrumentCache | None = None
+
+
+def get_instrument_cache(directory: str | None = None) -> InstrumentCache:
+    """Process-wide InstrumentCache (one per batch worker process)."""
+    global _instrument_cache
+    if _instrument_cache is None or _instrument_cache.directory != directory:
+        _instrument_cache = InstrumentCache(directory)
+    return _instrument_cache
+
+
+def _fetch_respondents(sb: Client, campaign_id: str) -> list[dict]:
+    return _fetch_all(
+        lambda: sb.table("respondents")
+        .select("id, department, tenure, gender")
+        .eq("campaign_id", campaign_id)
+        .eq("status", "completed")
+    )
+
+
 def fetch_campaign_data(
-    sb: Client, campaign_id: str
+    sb: Client,
+    campaign_id: str,
+    pushdown: bool = False,
+    fallback: bool = True,
+    instruments: InstrumentCache | None = None,
 ) -> tuple[pd.DataFrame, list[str]] | None:
     """Return (respondent_vectors DataFrame, dim_codes list) or None.
 
-    DataFrame columns: dim_codes + ['_id', '_dept']
+    DataFrame columns: dim_codes + ['_id', '_dept', '_tenure', '_gender']
+
+    With pushdown=True the dimension means are computed in the database via
+    the ona_respondent_vectors RPC; if that call fails (e.g. the migration
+    isn't applied) the client-side path runs instead unless fallback=False.
+    Dimension and item metadata come from `instruments` (a fresh, unshared
+    cache if omitted).
     """
-    camp = (
-        sb.table("campaigns")
+    instruments = instruments or InstrumentCache()
+    camp = _execute(
+        lambda: sb.table("campaigns")
         .select("instrument_id, module_instrument_ids")
         .eq("id", campaign_id)
         .single()
-        .execute()
     )
     if not camp.data:
         print(f"  Campaign {campaign_id} not found")
@@ -89,132 +553,357 @@ def fetch_campaign_data(
         camp.data.get("module_instrument_ids") or []
     )
 
-    dims = (
-        sb.table("dimensions")
-        .select("id, code, instrument_id")
-        .in_("instrument_id", instrument_ids)
-        .execute()
-    )
-    dim_rows = [d for d in (dims.data or []) if d["code"] != ENG_CODE]
-    if not dim_rows:
+    # Respondents don't depend on the instrument metadata: fetch them while
+    # it is resolved (the pushdown RPC returns them itself).
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        respondents_future = (
+            None if pushdown else pool.submit(_fetch_respondents, sb, campaign_id)
+        )
+        dim_codes, item_map = instruments.resolve(sb, instrument_ids)
+        resp_list = respondents_future.result() if respondents_future else None
+    if not dim_codes:
         print("  No dimensions found")
         return None
-    dim_codes = sorted(set(d["code"] for d in dim_rows))
-    dim_id_to_code = {d["id"]: d["code"] for d in dim_rows}
-
-    items = (
-        sb.table("items")
-        .select("id, dimension_id, is_reverse, is_attention_check")
-        .in_("dimension_id", list(dim_id_to_code.keys()))
-        .execute()
-    )
-    item_map: dict[str, dict] = {}
-    for it in items.data or []:
-        if it["is_attention_check"]:
-            continue
-        dim_code = dim_id_to_code.get(it["dimension_id"])
-        if dim_code:
-            item_map[it["id"]] = {"code": dim_code, "reverse": it["is_reverse"]}
-
-    respondents = (
-        sb.table("respondents")
-        .select("id, department, tenure, gender")
-        .eq("campaign_id", campaign_id)
-        .eq("status", "completed")
-        .execute()
-    )
-    resp_list = respondents.data or []
+
+    if pushdown:
+        try:
+            resp_list, means = _fetch_vectors_rpc(sb, campaign_id, dim_codes)
+        except PostgrestAPIError as exc:
+            if not fallback:
+                raise
+            print(f"  Pushdown unavailable ({exc.code}), aggregating client-side")
+            pushdown = False
+            resp_list = _fetch_respondents(sb, campaign_id)
+
     if len(resp_list) < MIN_RESPONDENTS:
         print(f"  Only {len(resp_list)} valid respondents (min {MIN_RESPONDENTS})")
         return None
 
-    resp_ids = [r["id"] for r in resp_list]
-    meta_map = {r["id"]: r for r in resp_list}
+    if not pushdown:
+        resp_ids = [r["id"] for r in resp_list]
+        all_responses = _fetch_responses(sb, resp_ids)
+
+        means = _aggregate_responses(all_responses, resp_ids, dim_codes, item_map)
+
+    df = _vector_frame(resp_list, dim_codes, means)
+    if df is None:
+        return None
+    mode = "pushdown" if pushdown else "client"
+    print(f"  Vectors: {len(df)} respondents × {len(dim_codes)} dimensions ({mode})")
+    return df, dim_codes
 
-    all_responses: list[dict] = []
-    for i in range(0, len(resp_ids), 50):
-        batch = resp_ids[i : i + 50]
-        res = (
-            sb.table("responses")
-            .select("respondent_id, item_id, score")
-            .in_("respondent_id", batch)
-            .execute()
-        )
-        all_responses.extend(res.data or [])
 
-    resp_dim_scores: dict[str, dict[str, list[float]]] = {
-        rid: {c: [] for c in dim_codes} for rid in resp_ids
+def verify_pushdown(sb: Client, campaign_id: str) -> bool:
+    """Check that the pushdown RPC yields exactly the client-side vectors."""
+    instruments = InstrumentCache()
+    client = fetch_campaign_data(sb, campaign_id, instruments=instruments)
+    server = fetch_campaign_data(
+        sb, campaign_id, pushdown=True, fallback=False, instruments=instruments
+    )
+    if client is None or server is None:
+        ok = client is None and server is None
+    else:
+        ok = client[1] == server[1] and client[0].equals(server[0])
+    print(f"  Pushdown {'matches' if ok else 'DIFFERS FROM'} client-side aggregation")
+    return ok
+
+
+def _fingerprint(source: str, inputs: str, opts: ONAOptions) -> str:
+    """sha256 of an input checksum plus every parameter that shapes the result."""
+    params = {
+        "version": FINGERPRINT_VERSION,
+        "min_respondents": MIN_RESPONDENTS,
+        "density": [DENSITY_MIN, DENSITY_MAX],
+        "sparse_min_nodes": SPARSE_GRAPH_MIN_NODES,
+        "knn_edge_budget": KNN_EDGE_BUDGET,
+        "graph_mode": opts.graph_mode,
+        "kernel": opts.kernel,
+        "dtype": opts.dtype,
+        "stability_iterations": opts.stability_iterations,
+        "seed": opts.seed,
+        "centrality": opts.centrality,
+        "betweenness_samples": opts.betweenness_samples,
+        "longitudinal": opts.longitudinal,
+        "resolutions": list(opts.resolutions),
+        "resolution_objective": opts.resolution_objective,
+        "bootstrap": opts.bootstrap,
+        "null_models": opts.null_models,
+        "null_model": opts.null_model,
+        # Tunables with no flag: editing one must not leave results "unchanged"
+        "stability_check": [STABILITY_CHECK_EVERY, STABILITY_TOLERANCE],
+        "consensus": CONSENSUS_THRESHOLD,
+        "warm_start": [LEIDEN_WARM_ITERATIONS, WARM_START_MIN_SHARE, LONGITUDINAL_LOOKBACK],
+        "sweep_runs": SWEEP_RUNS,
+        "null": [NULL_REWIRE_TRIALS, NULL_LEIDEN_RUNS, NULL_ALPHA],
+        "bootstrap_level": [BOOTSTRAP_CONFIDENCE, BOOTSTRAP_BATCH],
+        "approx_betweenness_min_nodes": APPROX_BETWEENNESS_MIN_NODES,
+        "layout": [LAYOUT_FR_MAX_NODES, LAYOUT_BACKBONE_K, LAYOUT_WARM_ITERATIONS, IMAGE_MAX_EDGES],
     }
-    for r in all_responses:
-        info = item_map.get(r["item_id"])
-        if not info:
-            continue
-        score = r["score"]
-        if info["reverse"]:
-            score = 6 - score
-        resp_dim_scores[r["respondent_id"]][info["code"]].append(float(score))
-
-    rows = []
-    for rid in resp_ids:
-        vec = {}
-        valid = True
-        for code in dim_codes:
-            scores = resp_dim_scores[rid][code]
-            if not scores:
-                valid = False
-                break
-            vec[code] = float(np.mean(scores))
-        if valid:
-            vec["_id"] = rid
-            vec["_dept"] = meta_map[rid].get("department") or "Sin departamento"
-            vec["_tenure"] = meta_map[rid].get("tenure") or ""
-            vec["_gender"] = meta_map[rid].get("gender") or ""
-            rows.append(vec)
-
-    if len(rows) < MIN_RESPONDENTS:
-        print(f"  Only {len(rows)} respondents with complete vectors (min {MIN_RESPONDENTS})")
+    payload = json.dumps({"source": source, "inputs": inputs, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def input_fingerprint(sb: Client, campaign_id: str, opts: ONAOptions) -> str | None:
+    """Fingerprint from the ona_input_checksum RPC, before any data is fetched.
+
+    None if the RPC is unavailable (migration not applied) or the campaign
+    doesn't exist; process_campaign then fingerprints the fetched vectors.
+    """
+    try:
+        res = _execute(
+            lambda: sb.rpc("ona_input_checksum", {"p_campaign_id": campaign_id})
+        )
+    except PostgrestAPIError as exc:
+        print(f"  Input checksum unavailable ({exc.code}), fingerprinting vectors")
         return None
+    return _fingerprint("rpc", res.data, opts) if res.data else None
+
+
+def vectors_fingerprint(df: pd.DataFrame, dim_codes: list[str], opts: ONAOptions) -> str:
+    """Fallback fingerprint of the fetched respondent vectors and metadata."""
+    digest = hashlib.sha256("\x1f".join(dim_codes).encode())
+    for col in ("_id", "_dept", "_tenure", "_gender"):
+        digest.update("\x1f".join(df[col]).encode())
+    digest.update(np.ascontiguousarray(df[dim_codes].to_numpy(dtype=np.float64)).tobytes())
+    return _fingerprint("vectors", digest.hexdigest(), opts)
 
-    df = pd.DataFrame(rows)
-    print(f"  Vectors: {len(df)} respondents × {len(dim_codes)} dimensions")
-    return df, dim_codes
+
+def _lineage_digest(
+    previous_id: str, previous_fingerprint: str | None, returning: dict[str, int]
+) -> str:
+    """sha256 of what a longitudinal run inherits: the prior campaign, its
+    stored fingerprint and each returning respondent's prior community."""
+    digest = hashlib.sha256(f"{previous_id}\x1f{previous_fingerprint or ''}".encode())
+    for rid in sorted(returning):
+        digest.update(f"\x1f{rid}:{returning[rid]}".encode())
+    return digest.hexdigest()
+
+
+def _chain_fingerprint(fingerprint: str | None, lineage: str | None) -> str | None:
+    """Fold a longitudinal lineage digest into an input fingerprint."""
+    if fingerprint is None or lineage is None:
+        return fingerprint
+    return hashlib.sha256(f"{fingerprint}\x1f{lineage}".encode()).hexdigest()
+
+
+def stored_fingerprint(sb: Client, campaign_id: str) -> str | None:
+    """input_fingerprint of the saved ona_network result, if any."""
+    res = _execute(
+        lambda: sb.table("campaign_analytics")
+        .select("fingerprint:data->>input_fingerprint")
+        .eq("campaign_id", campaign_id)
+        .eq("analysis_type", "ona_network")
+        .limit(1)
+    )
+    return res.data[0].get("fingerprint") if res.data else None
 
 
 # ---------------------------------------------------------------------------
 # 2. Build similarity graph — returns igraph.Graph
 # ---------------------------------------------------------------------------
-def build_similarity_graph(
-    df: pd.DataFrame, dim_codes: list[str]
-) -> ig.Graph:
-    """Cosine similarity graph with adaptive threshold targeting 10-30% density."""
-    vectors = df[dim_codes].values  # (n, d)
+def _similarity_tiles(
+    vectors: np.ndarray, kernel: str = SIM_KERNEL, dtype: str = SIM_DTYPE
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Yield (start, tile): rows [start, start + len(tile)) of the n×n similarity.
+
+    Every kernel is a normalised matrix product, so tiles go through BLAS
+    and only SIM_TILE_BYTES of similarities are alive at once:
+      cosine  — rows scaled to unit norm, U·Uᵀ
+      pearson — rows centred, then as cosine
+      rbf     — exp(−γ‖x−y‖²) with ‖x−y‖² = ‖x‖² + ‖y‖² − 2x·y and
+                γ = 1 / (d · var(X)) (scikit-learn's "scale")
+    """
+    X = np.asarray(vectors, dtype=dtype)
+    n, d = X.shape
+    if kernel == "pearson":
+        X = X - X.mean(axis=1, keepdims=True)
+    if kernel in ("cosine", "pearson"):
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        X = X / np.where(norms > 0, norms, 1)
+    elif kernel == "rbf":
+        sq_norms = np.einsum("ij,ij->i", X, X)
+        var = float(X.var())
+        gamma = 1.0 / (d * var) if var > 0 else 1.0
+    else:
+        raise ValueError(f"Unknown similarity kernel: {kernel}")
+
+    rows_per_tile = max(1, SIM_TILE_BYTES // (n * X.itemsize))
+    for start in range(0, n, rows_per_tile):
+        tile = X[start : start + rows_per_tile] @ X.T
+        if kernel == "rbf":
+            tile *= -2
+            tile += sq_norms[start : start + len(tile), None]
+            tile += sq_norms[None, :]
+            np.maximum(tile, 0, out=tile)
+            tile *= -gamma
+            np.exp(tile, out=tile)
+        yield start, tile
+
+
+def _dense_edges(
+    vectors: np.ndarray, kernel: str = SIM_KERNEL, dtype: str = SIM_DTYPE,
+    n_edges: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """All pairs above an adaptive threshold targeting DENSITY_MIN-DENSITY_MAX,
+    or above the n_edges-th largest similarity when n_edges is given.
+
+    Similarities are streamed in two passes over the tiles: the first keeps
+    only their range and a SIM_HISTOGRAM_BINS histogram, which settles the
+    threshold; the second keeps the pairs above it. Memory is one tile plus
+    the edges themselves (still 10-30% of n²/2 pairs; kNN mode bounds those).
+
+    Return (src, dst, weights, threshold) with src < dst in row-major order.
+    """
     n = len(vectors)
-
-    # Compute full similarity matrix (vectorized with scipy)
-    dists = pdist(vectors, metric="cosine")
-    sim_matrix = 1.0 - squareform(dists)
-    np.fill_diagonal(sim_matrix, 1.0)
-
-    # Adaptive threshold via binary search targeting 10-30% edge density
-    upper_tri = sim_matrix[np.triu_indices(n, k=1)]
     max_edges = n * (n - 1) / 2
-    lo, hi = float(np.min(upper_tri)), float(np.max(upper_tri))
-    best_threshold = (lo + hi) / 2
-
-    for _ in range(40):
-        mid = (lo + hi) / 2
-        edge_count = int(np.sum(upper_tri >= mid))
+    bins = SIM_HISTOGRAM_BINS
+    cols = np.arange(n)
+
+    def upper_tiles() -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        for start, tile in _similarity_tiles(vectors, kernel, dtype):
+            rows = np.arange(start, start + len(tile))
+            yield rows, tile, cols[None, :] > rows[:, None]
+
+    def bin_of(x):
+        # Every kernel lands in [-1, 1]; float64 keeps scalars and values on
+        # the same side of a bin edge
+        scaled = (np.asarray(x, dtype=np.float64) + 1.0) * (bins / 2)
+        return np.clip(np.floor(scaled), 0, bins - 1).astype(np.int64)
+
+    # Pass 1: range and histogram of the upper triangle
+    hist = np.zeros(bins, dtype=np.int64)
+    lo, hi = np.inf, -np.inf
+    for _, tile, upper in upper_tiles():
+        values = tile[upper]
+        if len(values):
+            lo, hi = min(lo, float(values.min())), max(hi, float(values.max()))
+            hist += np.bincount(bin_of(values), minlength=bins)
+    at_least = np.append(np.cumsum(hist[::-1])[::-1], 0)  # pairs in bins ≥ b
+
+    def count_above(threshold: float) -> int:
+        return sum(int((tile[upper] >= threshold).sum()) for _, tile, upper in upper_tiles())
+
+    def side(edge_count: int) -> int:
         density = edge_count / max_edges if max_edges > 0 else 0
-        if 0.10 <= density <= 0.30:
+        return -1 if density < DENSITY_MIN else 1 if density > DENSITY_MAX else 0
+
+    best_threshold = (lo + hi) / 2
+    if n_edges is not None:  # fixed edge count (null models)
+        # The n_edges-th largest lies in the highest bin reaching that count;
+        # one more pass pulls that bin's values to pick it exactly
+        k = max(1, min(n_edges, int(at_least[0])))
+        b = int(np.searchsorted(-at_least, -k, side="right")) - 1
+        in_bin = np.concatenate([
+            v[bin_of(v) == b] for v in (tile[upper] for _, tile, upper in upper_tiles())
+        ])
+        best_threshold = float(np.sort(in_bin)[::-1][k - int(at_least[b + 1]) - 1])
+    else:
+        # Binary search targeting 10-30% edge density. The histogram bounds
+        # each step's edge count; a tile pass recounts only when the bin
+        # holding the midpoint straddles a density limit.
+        for _ in range(40):
+            mid = (lo + hi) / 2
+            b = int(bin_of(mid))
+            step = side(int(at_least[b + 1]))
+            if step != side(int(at_least[b])):
+                step = side(count_above(mid))
+            if step == 0:
+                best_threshold = mid
+                break
+            elif step < 0:
+                hi = mid
+            else:
+                lo = mid
             best_threshold = mid
-            break
-        elif density < 0.10:
-            hi = mid
-        else:
-            lo = mid
-        best_threshold = mid
-        if hi - lo < 1e-6:
-            break
+            if hi - lo < 1e-6:
+                break
+
+    # Pass 2: the pairs above the threshold, row-major within and across tiles
+    src, dst, weights = [], [], []
+    for rows, tile, upper in upper_tiles():
+        keep = upper & (tile >= best_threshold)
+        i, j = np.nonzero(keep)
+        src.append(rows[i])
+        dst.append(j)
+        weights.append(tile[keep])
+    return np.concatenate(src), np.concatenate(dst), np.concatenate(weights), best_threshold
+
+
+def _knn_k(n: int) -> int:
+    """Neighbours per node: enough for DENSITY_MIN, capped by KNN_EDGE_BUDGET."""
+    wanted = int(np.ceil(DENSITY_MIN * (n - 1)))
+    return max(1, min(wanted, KNN_EDGE_BUDGET // max(n, 1), n - 1))
+
+
+def _knn_edges(
+    vectors: np.ndarray, k: int,
+    kernel: str = SIM_KERNEL, dtype: str = SIM_DTYPE,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Union of each node's top-k neighbours, scanned tile by tile.
+
+    Only one SIM_TILE_BYTES tile of similarities exists at any time, so
+    memory grows with n·k instead of n². Return (src, dst, weights) with
+    src < dst, sorted by (src, dst).
+    """
+    n = len(vectors)
+    src_parts, dst_parts, w_parts = [], [], []
+    for start, tile in _similarity_tiles(vectors, kernel, dtype):
+        rows = np.arange(start, start + len(tile))
+        tile[rows - start, rows] = -np.inf  # no self-loops
+        nbrs = np.argpartition(tile, -k, axis=1)[:, -k:]
+        src_parts.append(np.repeat(rows, k))
+        dst_parts.append(nbrs.ravel())
+        w_parts.append(np.take_along_axis(tile, nbrs, axis=1).ravel())
+
+    src = np.concatenate(src_parts)
+    dst = np.concatenate(dst_parts)
+    weights = np.concatenate(w_parts)
+
+    # i→j and j→i collapse to one undirected edge (similarity is symmetric)
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    _, first = np.unique(lo.astype(np.int64) * n + hi, return_index=True)
+    return lo[first], hi[first], weights[first]
+
+
+def _similarity_edges(
+    vectors: np.ndarray, mode: str, kernel: str, dtype: str,
+    k: int = 0, n_edges: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, str]:
+    """Positive-weight (src, dst, weights) of a dense or kNN graph, plus a
+    short description of the threshold or k for the progress line. n_edges
+    fixes the dense graph's edge count instead of searching a threshold."""
+    if mode == "knn":
+        src, dst, weights = _knn_edges(vectors, k, kernel, dtype)
+        detail = f"k={k}"
+    else:
+        src, dst, weights, threshold = _dense_edges(vectors, kernel, dtype, n_edges)
+        detail = f"threshold={threshold:.3f}"
+
+    positive = weights > 0
+    if not positive.all():
+        src, dst, weights = src[positive], dst[positive], weights[positive]
+    return src, dst, weights, detail
+
+
+def build_similarity_graph(
+    df: pd.DataFrame, dim_codes: list[str], mode: str = GRAPH_MODE,
+    kernel: str = SIM_KERNEL, dtype: str = SIM_DTYPE,
+) -> ig.Graph:
+    """Similarity graph targeting DENSITY_MIN-DENSITY_MAX edge density.
+
+    mode="dense" thresholds every pair's similarity; mode="knn" keeps each
+    node's top-k neighbours without materialising the n×n matrix (the
+    density then follows from k, see _knn_k). mode="auto" picks knn from
+    SPARSE_GRAPH_MIN_NODES respondents. kernel selects cosine, pearson or
+    rbf similarity (see _similarity_tiles); dtype="float32" trades ~7
+    significant digits for half the memory. Mode and kernel are stored as
+    graph attributes. Non-positive similarities never become edges, since
+    Leiden and the centralities need positive weights.
+    """
+    vectors = df[dim_codes].values  # (n, d)
+    n = len(vectors)
+    if mode == "auto":
+        mode = "knn" if n >= SPARSE_GRAPH_MIN_NODES else "dense"
 
     # Build igraph Graph
     ids = df["_id"].tolist()
@@ -224,23 +913,26 @@ def build_similarity_graph(
     g.add_vertices(n)
     g.vs["respondent_id"] = ids
     g.vs["department"] = depts
+    g.vs["tenure"] = [t or "Sin dato" for t in df["_tenure"]]
+    g.vs["gender"] = [x or "Sin dato" for x in df["_gender"]]
     g.vs["label"] = [rid[:6] for rid in ids]
+    g["mode"] = mode
+    g["kernel"] = kernel
 
-    edges = []
-    weights = []
-    for i in range(n):
-        for j in range(i + 1, n):
-            if sim_matrix[i, j] >= best_threshold:
-                edges.append((i, j))
-                weights.append(float(sim_matrix[i, j]))
+    if mode == "knn":
+        g["knn_k"] = _knn_k(n)
+    src, dst, weights, detail = _similarity_edges(
+        vectors, mode, kernel, dtype, g["knn_k"] if mode == "knn" else 0
+    )
 
-    g.add_edges(edges)
-    g.es["weight"] = weights
+    # Hand the edge arrays to igraph in bulk
+    g.add_edges(np.column_stack((src, dst)))
+    g.es["weight"] = weights.tolist()
 
     actual_density = g.density()
     print(
-        f"  Graph: {g.vcount()} nodes, {g.ecount()} edges, "
-        f"threshold={best_threshold:.3f}, density={actual_density:.3f}"
+        f"  Graph ({mode}, {kernel}): {g.vcount()} nodes, {g.ecount()} edges, "
+        f"{detail}, density={actual_density:.3f}"
     )
     return g
 
@@ -248,84 +940,700 @@ def build_similarity_graph(
 # ---------------------------------------------------------------------------
 # 3. Community detection with stability analysis (Leiden + NMI)
 # ---------------------------------------------------------------------------
+_worker_graph: ig.Graph | None = None  # set in each Leiden pool worker
+_worker_initial: list[int] | None = None  # warm-start membership, same workers
+
+
+def _init_leiden_worker(g: ig.Graph, initial: list[int] | None = None) -> None:
+    global _worker_graph, _worker_initial
+    _worker_graph = g
+    _worker_initial = initial
+
+
+def _leiden_run(
+    seed: int,
+    g: ig.Graph | None = None,
+    initial: list[int] | None = None,
+    objective: str = "modularity",
+    resolution: float = 1.0,
+) -> tuple[list[int], float]:
+    """One seeded Leiden run; return (membership, quality).
+
+    igraph draws from Python's `random` module, so seeding it makes the run
+    reproducible regardless of which process executes it. With an initial
+    membership the run refines it, which needs fewer iterations. Quality
+    is modularity for the default objective and resolution.
+    """
+    random.seed(seed)
+    if g is None:
+        g = _worker_graph
+        initial = _worker_initial if initial is None else initial
+    part = g.community_leiden(
+        objective_function=objective,
+        weights="weight",
+        resolution=resolution,
+        n_iterations=2 if initial is None else LEIDEN_WARM_ITERATIONS,
+        initial_membership=initial,
+    )
+    # .modularity is the objective at this resolution; .quality only for CPM
+    return part.membership, part.modularity if objective == "modularity" else part.quality
+
+
+def _nmi_matrix(memberships: np.ndarray) -> np.ndarray:
+    """Pairwise NMI (Danon et al., igraph's "nmi") between all runs at once.
+
+    memberships is (R, n) with labels 0..K-1. For each run a, the
+    contingency tables against every later run come from one pass over the
+    joint codes b·K² + label_a·K + label_b — a bincount while the (R, K, K)
+    stack is small, np.unique over the occupied cells otherwise — and the
+    mutual information of all pairs is reduced at once.
+    """
+    R, n = memberships.shape
+    K = int(memberships.max()) + 1
+    counts = np.stack([np.bincount(m, minlength=K) for m in memberships])  # (R, K)
+    p = counts / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(p > 0, p * np.log(p), 0.0).sum(axis=1)
+
+    nmi = np.eye(R)
+    for a in range(R - 1):
+        rest = memberships[a + 1 :]
+        codes = (np.arange(len(rest)) * K * K)[:, None] + memberships[a] * K + rest
+        if len(rest) * K * K <= NMI_DENSE_TABLE_MAX:
+            table = np.bincount(codes.ravel(), minlength=len(rest) * K * K)
+            cells = np.flatnonzero(table)
+            joint = table[cells]
+        else:
+            cells, joint = np.unique(codes, return_counts=True)
+        b, cell = np.divmod(cells, K * K)
+        ia, ib = np.divmod(cell, K)
+        terms = joint * np.log(joint * n / (counts[a, ia] * counts[a + 1 + b, ib]))
+        mutual = np.bincount(b, weights=terms, minlength=len(rest)) / n
+        denom = entropy[a] + entropy[a + 1 :]
+        row = np.where(denom > 0, 2 * mutual / np.where(denom > 0, denom, 1), 1.0)
+        nmi[a, a + 1 :] = row
+        nmi[a + 1 :, a] = row
+    return nmi
+
+
+def _mean_pairwise_nmi(memberships: np.ndarray) -> float:
+    """Exact mean NMI over every pair of runs."""
+    R = len(memberships)
+    if R < 2:
+        return 0.0
+    return float(_nmi_matrix(memberships)[np.triu_indices(R, k=1)].mean())
+
+
+def _consensus_partition(
+    g: ig.Graph, memberships: np.ndarray, seed: int
+) -> tuple[list[int], np.ndarray]:
+    """Consensus partition of the ensemble and per-node assignment confidence.
+
+    The co-association of i and j is the fraction of runs that put them in
+    the same community. It is scored on the graph's edges only, in chunks,
+    so memory follows the edge count: over all pairs it would be ~n²/K
+    entries however sparsely it is built. Edges co-assigned in at least
+    CONSENSUS_THRESHOLD of the runs form a weighted consensus graph that a
+    seeded Leiden run partitions. A node's confidence is its mean
+    co-association with its graph neighbours in its consensus community;
+    one minus its strongest co-association if it has none there.
+    """
+    R, n = memberships.shape
+    edges = np.array(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    src, dst = edges[:, 0], edges[:, 1]
+    # Chunks of ~2^18 run × edge comparisons keep the temporaries small
+    weights = np.empty(len(edges))
+    chunk = max(1, 2**18 // R)
+    for i in range(0, len(edges), chunk):
+        weights[i : i + chunk] = (
+            memberships[:, src[i : i + chunk]] == memberships[:, dst[i : i + chunk]]
+        ).mean(axis=0)
+
+    kept = weights >= CONSENSUS_THRESHOLD
+    cg = ig.Graph(n=n)
+    cg.add_edges(edges[kept])
+    random.seed(seed)
+    consensus = cg.community_leiden(
+        objective_function="modularity", weights=weights[kept].tolist(), n_iterations=-1
+    ).membership
+
+    # Per-node sums over incident edges count both endpoints
+    labels = np.asarray(consensus)
+    same = labels[src] == labels[dst]
+    scored = np.bincount(src, weights=same, minlength=n) + np.bincount(dst, weights=same, minlength=n)
+    agreement = (np.bincount(src, weights=weights * same, minlength=n)
+                 + np.bincount(dst, weights=weights * same, minlength=n))
+    strongest = np.zeros(n)
+    np.maximum.at(strongest, src, weights)
+    np.maximum.at(strongest, dst, weights)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        confidence = np.where(scored > 0, agreement / scored, 1.0 - strongest)
+    return consensus, confidence
+
+
 def detect_communities_with_stability(
-    g: ig.Graph, n_iterations: int = STABILITY_ITERATIONS
-) -> tuple[ig.VertexClustering, float, str]:
+    g: ig.Graph,
+    n_iterations: int = STABILITY_ITERATIONS,
+    seed: int = STABILITY_SEED,
+    workers: int = STABILITY_WORKERS,
+    initial_membership: list[int] | None = None,
+) -> tuple[ig.VertexClustering, dict]:
     """
-    Run Leiden community detection n_iterations times.
-    Return (best_partition, stability_nmi, stability_label).
+    Run Leiden community detection up to n_iterations times.
+    Return (best_partition, stability) where stability holds nmi (exact
+    mean over every pair of runs), label, iterations (runs actually used),
+    seed, whether it converged early and the ensemble's consensus partition
+    with per-respondent confidence (see _consensus_partition).
 
-    stability_nmi: mean pairwise NMI across all iterations.
+    stability nmi: mean pairwise NMI across the runs.
       > 0.80 → robust (the same communities appear consistently)
       0.50-0.80 → moderate (some variation between runs)
       < 0.50 → weak (communities are unstable, likely noise)
+
+    Run i is seeded with the i-th value of a SeedSequence derived from
+    `seed`, and runs are consumed in index order, so results are identical
+    for any worker count. Every STABILITY_CHECK_EVERY runs the NMI estimate
+    is compared with the previous checkpoint; once it moves less than
+    STABILITY_TOLERANCE the remaining runs are cancelled.
+
+    With initial_membership (longitudinal mode) every run starts from it
+    instead of singletons; stability then measures agreement around the
+    prior structure and stability["warm_start"] is True.
     """
-    partitions = []
-    modularities = []
+    seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(n_iterations)]
+    use_pool = workers > 1 and g.ecount() >= LEIDEN_POOL_MIN_EDGES
+
+    memberships: list[list[int]] = []
+    modularities: list[float] = []
+    previous = None
+    converged = False
 
-    for i in range(n_iterations):
-        part = g.community_leiden(
-            objective_function="modularity",
-            weights="weight",
-            n_iterations=2,
-            # No fixed seed → each run explores different random orderings
+    pool = (
+        ProcessPoolExecutor(
+            workers, initializer=_init_leiden_worker, initargs=(g, initial_membership)
         )
-        partitions.append(part)
-        modularities.append(part.modularity)
+        if use_pool else None
+    )
+    try:
+        if pool:
+            runs = (f.result() for f in [pool.submit(_leiden_run, s) for s in seeds])
+        else:
+            runs = (_leiden_run(s, g, initial_membership) for s in seeds)
+
+        for i, (membership, q) in enumerate(runs, start=1):
+            memberships.append(membership)
+            modularities.append(q)
+            if i % STABILITY_CHECK_EVERY == 0 and i < n_iterations:
+                estimate = _mean_pairwise_nmi(np.asarray(memberships))
+                if previous is not None and abs(estimate - previous) < STABILITY_TOLERANCE:
+                    converged = True
+                    break
+                previous = estimate
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
 
     # Best partition = highest modularity
     best_idx = int(np.argmax(modularities))
-    best_partition = partitions[best_idx]
-
-    # Pairwise NMI (sample if too many pairs)
-    n_partitions = len(partitions)
-    if n_partitions <= 20:
-        # All pairs
-        nmis = []
-        for i in range(n_partitions):
-            for j in range(i + 1, n_partitions):
-                nmi = ig.compare_communities(
-                    partitions[i], partitions[j], method="nmi"
-                )
-                nmis.append(nmi)
-    else:
-        # Sample ~200 pairs
-        import random
-        random.seed(42)
-        nmis = []
-        for _ in range(200):
-            i, j = random.sample(range(n_partitions), 2)
-            nmi = ig.compare_communities(
-                partitions[i], partitions[j], method="nmi"
-            )
-            nmis.append(nmi)
+    best_partition = ig.VertexClustering(
+        g, memberships[best_idx], modularity_params={"weights": "weight"}
+    )
 
-    stability = float(np.mean(nmis)) if nmis else 0.0
+    runs_matrix = np.asarray(memberships)
+    nmi_pairs = _nmi_matrix(runs_matrix)[np.triu_indices(len(runs_matrix), k=1)]
+    nmi = float(nmi_pairs.mean()) if len(nmi_pairs) else 0.0
 
-    if stability >= 0.80:
+    if nmi >= 0.80:
         label = "robust"
-    elif stability >= 0.50:
+    elif nmi >= 0.50:
         label = "moderate"
     else:
         label = "weak"
 
+    consensus, confidence = _consensus_partition(g, runs_matrix, seed)
+    agreement = _nmi_matrix(np.asarray([memberships[best_idx], consensus]))[0, 1]
+
     print(
         f"  Leiden: {len(best_partition)} communities, "
         f"modularity={best_partition.modularity:.3f}, "
-        f"stability={stability:.3f} ({label})"
+        f"stability={nmi:.3f} ({label}), runs={len(memberships)}"
+        f"{' (converged)' if converged else ''}"
+        f"{' (warm start)' if initial_membership is not None else ''}, "
+        f"consensus={max(consensus) + 1} communities"
+    )
+    stability = {
+        "nmi": nmi,
+        "label": label,
+        "iterations": len(memberships),
+        "method": "leiden",
+        "seed": seed,
+        "converged": converged,
+        "warm_start": initial_membership is not None,
+        "nmi_min": round(float(nmi_pairs.min()), 4) if len(nmi_pairs) else 0.0,
+        "consensus": {
+            "communities": max(consensus) + 1,
+            "agreement_nmi": round(float(agreement), 4),
+            "mean_confidence": round(float(confidence.mean()), 4),
+            "low_confidence": int((confidence < CONSENSUS_THRESHOLD).sum()),
+            "ids": [rid[:8] for rid in g.vs["respondent_id"]],
+            "membership": consensus,
+            "confidence": [round(float(c), 3) for c in confidence],
+        },
+    }
+    return best_partition, stability
+
+
+def warm_start_membership(previous: np.ndarray) -> list[int] | None:
+    """Leiden initial membership from each respondent's previous community.
+
+    `previous` holds the prior community per vertex, -1 for newcomers, who
+    start as singletons. None when fewer than WARM_START_MIN_SHARE of the
+    respondents are returning: a cold start is then the better prior.
+    """
+    returning = previous >= 0
+    if returning.mean() < WARM_START_MIN_SHARE:
+        return None
+    initial = previous.copy()
+    initial[~returning] = previous.max() + 1 + np.arange((~returning).sum())
+    # Renumber densely: igraph expects ids 0..k-1
+    return np.unique(initial, return_inverse=True)[1].tolist()
+
+
+def community_transitions(
+    previous: np.ndarray, current: list[int], previous_campaign_id: str
+) -> dict:
+    """Where each current community came from, via a previous × current
+    overlap matrix over returning respondents (one bincount).
+
+    Per current community: its returning members, the previous community
+    holding most of them (`from`, share of the returning members) and the
+    Jaccard index of the two groups' returning members.
+    """
+    current_arr = np.asarray(current)
+    returning = previous >= 0
+    k_prev = int(previous.max()) + 1 if returning.any() else 0
+    k_cur = int(current_arr.max()) + 1
+    overlap = np.bincount(
+        previous[returning] * k_cur + current_arr[returning], minlength=k_prev * k_cur
+    ).reshape(k_prev, k_cur)
+    prev_sizes, cur_sizes = overlap.sum(axis=1), overlap.sum(axis=0)
+
+    transitions = []
+    for c in range(k_cur):
+        entry = {
+            "community": c,
+            "size": int((current_arr == c).sum()),
+            "returning": int(cur_sizes[c]),
+            "from": None,
+            "from_share": 0.0,
+            "jaccard": 0.0,
+        }
+        if cur_sizes[c]:
+            p = int(overlap[:, c].argmax())
+            both = int(overlap[p, c])
+            entry.update(
+                {
+                    "from": p,
+                    "from_share": round(both / int(cur_sizes[c]), 4),
+                    "jaccard": round(both / int(prev_sizes[p] + cur_sizes[c] - both), 4),
+                }
+            )
+        transitions.append(entry)
+
+    return {
+        "previous_campaign_id": previous_campaign_id,
+        "returning": int(returning.sum()),
+        "coverage": round(float(returning.mean()), 4),
+        "transitions": transitions,
+        "overlap": overlap.tolist(),  # rows: previous communities, columns: current
+    }
+
+
+def _parent_communities(child: np.ndarray, parent: np.ndarray) -> list[int]:
+    """For each community of `child`, the `parent` community holding most
+    of its members (overlap matrix from one bincount)."""
+    k_child, k_parent = int(child.max()) + 1, int(parent.max()) + 1
+    overlap = np.bincount(child * k_parent + parent, minlength=k_child * k_parent)
+    return overlap.reshape(k_child, k_parent).argmax(axis=1).tolist()
+
+
+def resolution_sweep(
+    g: ig.Graph,
+    resolutions: tuple[float, ...],
+    objective: str = SWEEP_OBJECTIVE,
+    runs: int = SWEEP_RUNS,
+    seed: int = STABILITY_SEED,
+    workers: int = STABILITY_WORKERS,
+) -> tuple[dict, list[list[int]]]:
+    """Leiden partitions of one graph over a grid of resolutions.
+
+    Levels go from coarse to fine (ascending resolution). Each level's runs
+    warm-start from the previous level's best partition, so levels are
+    sequential; the `runs` seeded runs within a level are independent and
+    share one process pool. For "cpm" the grid is in multiples of the
+    graph's weighted density, so the same values suit any graph.
+
+    Returns (summary, memberships): per level the resolution, community
+    count and sizes, best quality, plain modularity (γ = 1), mean pairwise
+    NMI across its runs and each community's parent at the coarser level;
+    memberships holds each level's best partition, aligned with g.vs.
+    """
+    levels = sorted(set(resolutions))
+    scale = 1.0
+    if objective == "cpm":
+        scale = sum(g.es["weight"]) / max(1, g.vcount() * (g.vcount() - 1) / 2)
+    use_pool = workers > 1 and g.ecount() >= LEIDEN_POOL_MIN_EDGES
+    pool = (
+        ProcessPoolExecutor(workers, initializer=_init_leiden_worker, initargs=(g,))
+        if use_pool else None
+    )
+    objective_name = "CPM" if objective == "cpm" else "modularity"
+    summary_levels: list[dict] = []
+    memberships: list[list[int]] = []
+    previous: list[int] | None = None
+    try:
+        for level, resolution in enumerate(levels):
+            gamma = resolution * scale
+            seeds = [
+                int(x) for x in np.random.SeedSequence([seed, level]).generate_state(runs)
+            ]
+            if pool:
+                futures = [
+                    pool.submit(_leiden_run, x, None, previous, objective_name, gamma)
+                    for x in seeds
+                ]
+                results = [f.result() for f in futures]
+            else:
+                results = [_leiden_run(x, g, previous, objective_name, gamma) for x in seeds]
+
+            best = max(range(runs), key=lambda i: results[i][1])
+            membership = results[best][0]
+            runs_matrix = np.asarray([m for m, _ in results])
+            nmi_pairs = _nmi_matrix(runs_matrix)[np.triu_indices(runs, k=1)]
+            sizes = np.bincount(membership)
+            summary_levels.append(
+                {
+                    "resolution": resolution,
+                    "communities": len(sizes),
+                    "sizes": sorted(sizes.tolist(), reverse=True),
+                    "quality": round(float(results[best][1]), 4),
+                    "modularity": round(g.modularity(membership, weights="weight"), 4),
+                    "stability": round(float(nmi_pairs.mean()), 4) if len(nmi_pairs) else 1.0,
+                    "parents": (
+                        _parent_communities(np.asarray(membership), np.asarray(previous))
+                        if previous is not None else None
+                    ),
+                }
+            )
+            memberships.append(membership)
+            previous = membership
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    print(
+        f"  Resolution sweep ({objective}): "
+        + ", ".join(
+            f"{lv['resolution']:g}→{lv['communities']}" for lv in summary_levels
+        )
+    )
+    return {"objective": objective, "runs": runs, "levels": summary_levels}, memberships
+
+
+_worker_null: tuple | None = None  # (graph, vectors, dtype) in each null-model worker
+
+
+def _init_null_worker(g: ig.Graph, vectors: np.ndarray | None, dtype: str) -> None:
+    global _worker_null
+    _worker_null = (g, vectors, dtype)
+
+
+def _null_modularity(seed: int, method: str, data: tuple | None = None) -> float:
+    """Best modularity of NULL_LEIDEN_RUNS Leiden runs on one null graph.
+
+    "rewire" applies degree-preserving edge swaps to the observed graph
+    and shuffles the observed weights over the rewired edges; "permute" shuffles each
+    dimension independently across respondents and rebuilds the graph
+    with the same mode, kernel and edge count (dense) or k (kNN), so
+    null and observed modularity are compared at equal density.
+    """
+    g, vectors, dtype = data or _worker_null
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    if method == "rewire":
+        null = g.copy()
+        null.rewire(n=NULL_REWIRE_TRIALS * g.ecount())  # drops edge attributes
+        null.es["weight"] = rng.permutation(np.asarray(g.es["weight"])).tolist()
+    else:
+        src, dst, weights, _ = _similarity_edges(
+            rng.permuted(vectors, axis=0), g["mode"], g["kernel"], dtype,
+            g["knn_k"] if "knn_k" in g.attributes() else 0, g.ecount(),
+        )
+        null = ig.Graph(n=g.vcount(), edges=np.column_stack((src, dst)))
+        null.es["weight"] = weights.tolist()
+    return _best_modularity(null, seed)
+
+
+def _best_modularity(g: ig.Graph, seed: int) -> float:
+    """Best modularity of NULL_LEIDEN_RUNS seeded Leiden runs on g."""
+    if g.ecount() == 0:
+        return 0.0
+    run_seeds = np.random.SeedSequence(seed).generate_state(NULL_LEIDEN_RUNS)
+    return max(_leiden_run(int(x), g)[1] for x in run_seeds)
+
+
+def null_model_significance(
+    g: ig.Graph, samples: int, method: str = NULL_MODEL,
+    vectors: np.ndarray | None = None, dtype: str = SIM_DTYPE,
+    seed: int = STABILITY_SEED, workers: int = STABILITY_WORKERS,
+) -> dict:
+    """Compare the observed modularity with Leiden on `samples` null graphs.
+
+    Near-uniform Likert answers still give cosine graphs with some
+    modularity; the null graphs show how much. The observed graph gets the
+    same treatment as each null graph (best of NULL_LEIDEN_RUNS runs), since
+    the best of the full stability ensemble would be biased upwards. p_value is the share of
+    null graphs reaching the observed modularity, (1 + hits) / (1 +
+    samples), and z its distance from the null mean in null standard
+    deviations (None when the null has no spread). Null graph i is seeded
+    from the i-th child of SeedSequence(seed), so results do not depend on
+    the worker count. "permute" needs the respondent × dimension vectors.
+    """
+    seeds = [
+        int(child.generate_state(1)[0])
+        for child in np.random.SeedSequence(seed).spawn(samples)
+    ]
+    data = (g, vectors, dtype)
+    observed = _best_modularity(g, seed)
+    if workers > 1 and samples > 1 and g.ecount() >= LEIDEN_POOL_MIN_EDGES:
+        with ProcessPoolExecutor(
+            min(workers, samples), initializer=_init_null_worker, initargs=data
+        ) as pool:
+            null = np.asarray(list(pool.map(_null_modularity, seeds, [method] * samples)))
+    else:
+        null = np.asarray([_null_modularity(x, method, data) for x in seeds])
+
+    mean, std = float(null.mean()), float(null.std(ddof=1)) if samples > 1 else 0.0
+    p_value = (1 + int((null >= observed).sum())) / (1 + samples)
+    z = (observed - mean) / std if std > 0 else None
+    print(
+        f"  Null model ({method}, {samples} graphs): modularity {observed:.3f} vs "
+        f"{mean:.3f} ± {std:.3f}, p={p_value:.3f}"
     )
-    return best_partition, stability, label
+    return {
+        "method": method,
+        "samples": samples,
+        "observed": round(observed, 4),
+        "null_mean": round(mean, 4),
+        "null_std": round(std, 4),
+        "z": None if z is None else round(z, 2),
+        "p_value": round(p_value, 4),
+        "significant": p_value <= NULL_ALPHA,
+    }
 
 
 # ---------------------------------------------------------------------------
 # 4. Compute ONA metrics — adapted for igraph
 # ---------------------------------------------------------------------------
+class CentralityCache:
+    """Centralities of one graph, each computed once and shared by stages.
+
+    Vertex and edge betweenness are all-sources shortest-path sweeps, the
+    dominant cost on 10-30% dense graphs. In approx mode (mode="auto" picks
+    it from APPROX_BETWEENNESS_MIN_NODES vertices) only `samples` uniformly
+    drawn sources are swept and the sums are rescaled by n / samples, an
+    unbiased estimate (Brandes & Pich 2007). By Hoeffding plus a union bound
+    over vertices, with 95% probability every betweenness normalised by
+    n(n-2)/2 is within error_bound of its exact value.
+    """
+
+    def __init__(
+        self, g: ig.Graph, mode: str = CENTRALITY_MODE,
+        samples: int = BETWEENNESS_SAMPLES, seed: int = STABILITY_SEED,
+    ):
+        self.g = g
+        n = g.vcount()
+        if mode == "auto":
+            mode = "approx" if n >= APPROX_BETWEENNESS_MIN_NODES else "exact"
+        self.sources: list[int] | None = None
+        if mode == "approx" and samples < n:
+            rng = np.random.default_rng(seed)
+            self.sources = np.sort(rng.choice(n, samples, replace=False)).tolist()
+        self.mode = "approx" if self.sources else "exact"
+        self._values: dict[str, list[float]] = {}
+
+    def _get(self, name: str, compute: Callable[[], list[float]]) -> list[float]:
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    def _rescale(self, values: list[float]) -> list[float]:
+        if self.sources is None:
+            return values
+        scale = self.g.vcount() / len(self.sources)
+        return [v * scale for v in values]
+
+    def betweenness(self) -> list[float]:
+        return self._get("betweenness", lambda: self._rescale(
+            self.g.betweenness(weights="weight", sources=self.sources)
+        ))
+
+    def edge_betweenness(self) -> list[float]:
+        return self._get("edge_betweenness", lambda: self._rescale(
+            self.g.edge_betweenness(weights="weight", sources=self.sources)
+        ))
+
+    def eigenvector(self) -> list[float]:
+        return self._get("eigenvector", lambda: self.g.eigenvector_centrality(weights="weight"))
+
+    def summary(self) -> dict:
+        if self.sources is None:
+            return {"mode": "exact", "samples": None, "error_bound": 0.0}
+        n, k = self.g.vcount(), len(self.sources)
+        bound = float(np.sqrt(np.log(2 * n / 0.05) / (2 * k)))
+        return {"mode": "approx", "samples": k, "error_bound": round(bound, 4)}
+
+
+def _group_density(g: ig.Graph, labels: list[str]) -> dict[str, dict[str, float | None]]:
+    """Edge density between every pair of groups of a categorical attribute.
+
+    Contracts the graph in one sparse product: with P the n×k group
+    indicator and A the (upper-triangular) adjacency, C = Pᵀ·A·P counts the
+    edges between groups (C[a, b] + C[b, a] for a ≠ b, C[a, a] within a).
+    Density is edges / possible pairs, None when a group has no possible
+    pair (a single-member group with itself). Keys are sorted group names.
+    """
+    groups, codes = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+    n, k = g.vcount(), len(groups)
+    indicator = sp.csr_matrix((np.ones(n), (np.arange(n), codes)), shape=(n, k))
+
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    adjacency = sp.csr_matrix(
+        (np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n)
+    )
+    counts = (indicator.T @ adjacency @ indicator).toarray()
+    counts = counts + counts.T - np.diag(np.diag(counts))
+
+    sizes = np.bincount(codes, minlength=k).astype(np.float64)
+    possible = np.outer(sizes, sizes)
+    np.fill_diagonal(possible, sizes * (sizes - 1) / 2)
+
+    density: dict[str, dict[str, float | None]] = {}
+    for a, ga in enumerate(groups):
+        density[ga] = {
+            gb: round(float(counts[a, b] / possible[a, b]), 3) if possible[a, b] > 0 else None
+            for b, gb in enumerate(groups)
+        }
+    return density
+
+
+def _community_profiles(
+    membership: list[int], df: pd.DataFrame, dim_codes: list[str],
+    global_means: dict[str, float],
+) -> tuple[list[dict], list[dict]]:
+    """Community profiles and discriminant dimensions in one grouped pass.
+
+    Vertices are stably sorted by community once (build_similarity_graph
+    keeps vertex i = row i of df), so each community is a contiguous slice:
+    dimension means are row sums over that slice (same pairwise summation
+    as pandas' Series.mean) and department counts come from a single
+    bincount over (community, department) pairs, ordered like value_counts
+    (count descending, ties by first appearance).
+    """
+    memb = np.asarray(membership, dtype=np.int64)
+    n, k = len(memb), int(memb.max()) + 1
+    order = np.argsort(memb, kind="stable")
+    sizes = np.bincount(memb, minlength=k)
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+
+    # (d, n) with each community's members contiguous along a row
+    scores_t = np.ascontiguousarray(df[dim_codes].to_numpy(dtype=np.float64)[order].T)
+    means = np.empty((k, len(dim_codes)))
+    for cidx in range(k):
+        means[cidx] = scores_t[:, starts[cidx]:starts[cidx + 1]].sum(axis=1) / sizes[cidx]
+    rounded = np.array([[round(x, 3) for x in row] for row in means.tolist()])
+
+    # Department counts per community, in value_counts order
+    dept_names, dept_idx = np.unique(df["_dept"].to_numpy(dtype=object), return_inverse=True)
+    pair = memb[order] * len(dept_names) + dept_idx[order]
+    pairs, first_seen, pair_counts = np.unique(pair, return_index=True, return_counts=True)
+    pair_comm = pairs // len(dept_names)
+    pairs_order = np.lexsort((first_seen, -pair_counts, pair_comm))
+    dept_dists: list[dict] = [{} for _ in range(k)]
+    for p in pairs_order:
+        cidx, count = int(pair_comm[p]), int(pair_counts[p])
+        dept_dists[cidx][dept_names[pairs[p] % len(dept_names)]] = {
+            "count": count, "pct": round(count / int(sizes[cidx]) * 100, 1),
+        }
+
+    diffs = rounded - np.array([global_means[c] for c in dim_codes])
+    top_idx = np.argsort(-np.abs(diffs), axis=1, kind="stable")[:, :3]
+
+    community_profiles = []
+    for cidx in range(k):
+        dim_scores = dict(zip(dim_codes, rounded[cidx].tolist()))
+        community_profiles.append({
+            "id": cidx,
+            "size": int(sizes[cidx]),
+            "pct": round(int(sizes[cidx]) / n * 100, 1),
+            "avg_score": round(float(np.mean(rounded[cidx])), 3),
+            "dominant_department": next(iter(dept_dists[cidx]), ""),
+            "department_distribution": dept_dists[cidx],
+            "dimension_scores": dim_scores,
+            "top_differences": [
+                {
+                    "code": dim_codes[j],
+                    "diff": round(float(diffs[cidx, j]), 3),
+                    "cluster_score": dim_scores[dim_codes[j]],
+                }
+                for j in top_idx[cidx]
+            ],
+        })
+
+    # Discriminant dimensions: spread of the rounded community means
+    discriminants = []
+    if k >= 2:
+        hi, lo = rounded.max(axis=0), rounded.min(axis=0)
+        hi_at, lo_at = rounded.argmax(axis=0), rounded.argmin(axis=0)
+        for j, code in enumerate(dim_codes):
+            discriminants.append({
+                "code": code,
+                "spread": round(float(hi[j] - lo[j]), 3),
+                "max_cluster": int(hi_at[j]),
+                "max_value": round(float(hi[j]), 3),
+                "min_cluster": int(lo_at[j]),
+                "min_value": round(float(lo[j]), 3),
+            })
+    discriminants.sort(key=lambda x: x["spread"], reverse=True)
+    return community_profiles, discriminants
+
+
+def _top_rounded(values: np.ndarray, n: int, digits: int) -> tuple[np.ndarray, list[float]]:
+    """Positions and rounded values of the n largest round(values, digits).
+
+    Same order as a stable sort on the rounded value (reverse=True) cut to
+    n, ties kept in position order. A partial selection first keeps only
+    values within rounding distance of the n-th largest, so only those are
+    rounded and sorted.
+    """
+    if len(values) > n:
+        cutoff = np.partition(values, len(values) - n)[len(values) - n]
+        candidates = np.flatnonzero(values >= cutoff - 2 * 10.0 ** -digits)
+    else:
+        candidates = np.arange(len(values))
+    rounded = np.array([round(x, digits) for x in values[candidates].tolist()])
+    order = np.argsort(-rounded, kind="stable")[:n]
+    return candidates[order], rounded[order].tolist()
+
+
 def compute_ona_metrics(
-    g: ig.Graph, partition: ig.VertexClustering,
-    stability: float, stability_label: str,
-    df: pd.DataFrame, dim_codes: list[str]
+    g: ig.Graph, partition: ig.VertexClustering, stability: dict,
+    df: pd.DataFrame, dim_codes: list[str],
+    centrality: CentralityCache | None = None,
 ) -> dict:
     """Centrality, profiles, discriminants, bridges, stability."""
+    centrality = centrality or CentralityCache(g)
 
     n_communities = len(partition)
     modularity = partition.modularity
@@ -336,162 +1644,104 @@ def compute_ona_metrics(
     # Community membership per vertex
     membership = partition.membership
 
+    # Graph as arrays: edge endpoints, degrees, community per vertex
+    n = g.vcount()
+    memb = np.asarray(membership, dtype=np.int64)
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    src, dst = edges[:, 0], edges[:, 1]
+    degree = np.bincount(edges.ravel(), minlength=n)
+
     # Centrality metrics
-    eigenvector_cent = g.eigenvector_centrality(weights="weight")
-    betweenness_cent = g.betweenness(weights="weight")
+    eigenvector_cent = centrality.eigenvector()
+    betweenness_cent = np.asarray(centrality.betweenness(), dtype=np.float64)
     # Normalize betweenness to [0,1]
-    max_btw = max(betweenness_cent) if betweenness_cent else 1.0
-    betweenness_norm = [b / max_btw if max_btw > 0 else 0 for b in betweenness_cent]
-    degree_cent = [g.degree(v) / (g.vcount() - 1) for v in range(g.vcount())]
+    max_btw = betweenness_cent.max()
+    betweenness_norm = betweenness_cent / max_btw if max_btw > 0 else np.zeros(n)
+    degree_cent = degree / (n - 1)
 
     # Edge betweenness (new metric)
-    edge_betweenness = g.edge_betweenness(weights="weight")
-    max_eb = max(edge_betweenness) if edge_betweenness else 1.0
-    edge_btw_norm = [eb / max_eb if max_eb > 0 else 0 for eb in edge_betweenness]
+    edge_betweenness = np.asarray(centrality.edge_betweenness(), dtype=np.float64)
+    max_eb = edge_betweenness.max()
+    edge_btw_norm = edge_betweenness / max_eb if max_eb > 0 else np.zeros(len(edges))
 
-    # Node metrics
+    # Node metrics, columnar (departments dictionary-encoded)
     ids = g.vs["respondent_id"]
     depts = g.vs["department"]
-    node_metrics = []
-    for v in range(g.vcount()):
-        node_metrics.append({
-            "id": ids[v][:8],
-            "department": depts[v],
-            "community": membership[v],
-            "eigenvector": round(eigenvector_cent[v], 4),
-            "betweenness": round(betweenness_norm[v], 4),
-            "degree": round(degree_cent[v], 4),
-            "connections": g.degree(v),
-        })
-
-    # Community profiles
-    id_to_index = {row["_id"]: i for i, row in df.iterrows()}
-    global_means = {c: float(df[c].mean()) for c in dim_codes}
-    community_profiles = []
+    dept_names, dept_codes = np.unique(np.asarray(depts, dtype=object), return_inverse=True)
+    nodes = {
+        "id": [rid[:8] for rid in ids],
+        "departments": dept_names.tolist(),
+        "department": dept_codes.tolist(),
+        "community": list(membership),
+        "eigenvector": [round(x, 4) for x in eigenvector_cent],
+        "betweenness": [round(x, 4) for x in betweenness_norm.tolist()],
+        "degree": [round(x, 4) for x in degree_cent.tolist()],
+        "connections": degree.tolist(),
+    }
 
-    for cidx in range(n_communities):
-        comm_vertices = [v for v in range(g.vcount()) if membership[v] == cidx]
-        comm_ids = [ids[v] for v in comm_vertices]
-        comm_indices = [id_to_index[rid] for rid in comm_ids if rid in id_to_index]
-        comm_df = df.iloc[comm_indices]
+    # Per-node consensus columns move to the node table
+    consensus = dict(stability.get("consensus", {}))
+    if "membership" in consensus:
+        consensus.pop("ids", None)
+        nodes["consensus"] = consensus.pop("membership")
+        nodes["confidence"] = consensus.pop("confidence")
 
-        dim_scores = {c: round(float(comm_df[c].mean()), 3) for c in dim_codes}
-        avg_score = round(float(np.mean(list(dim_scores.values()))), 3)
+    # Community profiles and discriminant dimensions
+    global_means = {c: float(df[c].mean()) for c in dim_codes}
+    community_profiles, discriminants = _community_profiles(
+        membership, df, dim_codes, global_means
+    )
 
-        dept_counts = comm_df["_dept"].value_counts().to_dict()
-        dept_dist = {
-            k: {"count": int(v), "pct": round(v / len(comm_df) * 100, 1)}
-            for k, v in dept_counts.items()
+    # Density heatmaps between departments, tenure bands and genders
+    dept_density = _group_density(g, depts)
+    tenure_density = _group_density(g, g.vs["tenure"])
+    gender_density = _group_density(g, g.vs["gender"])
+
+    # Bridge nodes: high betweenness and neighbours in 2+ communities,
+    # counted as distinct (vertex, neighbour community) pairs
+    btw_threshold = float(np.percentile(betweenness_norm, 75))
+    ends = np.concatenate([src, dst])
+    neighbor_comm = memb[np.concatenate([dst, src])]
+    communities_bridged = np.bincount(
+        np.unique(ends * n_communities + neighbor_comm) // n_communities, minlength=n
+    )
+    bridge_idx = np.flatnonzero(
+        (betweenness_norm >= btw_threshold) & (communities_bridged >= 2)
+    )
+    top, top_btw = _top_rounded(betweenness_norm[bridge_idx], 20, 4)
+    bridges = [
+        {
+            "id": ids[v][:8],
+            "department": depts[v],
+            "community": membership[v],
+            "betweenness": btw,
+            "communities_bridged": int(communities_bridged[v]),
+            "connections": int(degree[v]),
         }
-        dominant_dept = max(dept_counts, key=dept_counts.get) if dept_counts else ""
-
-        diffs = sorted(
-            [(c, dim_scores[c] - global_means[c]) for c in dim_codes],
-            key=lambda x: abs(x[1]), reverse=True,
-        )
-        top_diffs = [
-            {"code": c, "diff": round(d, 3), "cluster_score": dim_scores[c]}
-            for c, d in diffs[:3]
-        ]
-
-        community_profiles.append({
-            "id": cidx,
-            "size": len(comm_ids),
-            "pct": round(len(comm_ids) / g.vcount() * 100, 1),
-            "avg_score": avg_score,
-            "dominant_department": dominant_dept,
-            "department_distribution": dept_dist,
-            "dimension_scores": dim_scores,
-            "top_differences": top_diffs,
-        })
-
-    # Discriminant dimensions
-    discriminants = []
-    for code in dim_codes:
-        cluster_means = [p["dimension_scores"][code] for p in community_profiles]
-        if len(cluster_means) < 2:
-            continue
-        spread = max(cluster_means) - min(cluster_means)
-        discriminants.append({
-            "code": code,
-            "spread": round(spread, 3),
-            "max_cluster": int(np.argmax(cluster_means)),
-            "max_value": round(max(cluster_means), 3),
-            "min_cluster": int(np.argmin(cluster_means)),
-            "min_value": round(min(cluster_means), 3),
-        })
-    discriminants.sort(key=lambda x: x["spread"], reverse=True)
-
-    # Department density heatmap
-    all_depts = sorted(set(depts))
-    dept_density: dict[str, dict[str, float | None]] = {}
-    dept_to_vertices: dict[str, list[int]] = defaultdict(list)
-    for v in range(g.vcount()):
-        dept_to_vertices[depts[v]].append(v)
-
-    for da in all_depts:
-        dept_density[da] = {}
-        va = dept_to_vertices[da]
-        for db in all_depts:
-            vb = dept_to_vertices[db]
-            if not va or not vb:
-                dept_density[da][db] = None
-                continue
-            edge_count = 0
-            if da == db:
-                possible = len(va) * (len(va) - 1) / 2
-                for i, a in enumerate(va):
-                    for b in va[i + 1:]:
-                        if g.are_connected(a, b):
-                            edge_count += 1
-            else:
-                possible = len(va) * len(vb)
-                for a in va:
-                    for b in vb:
-                        if g.are_connected(a, b):
-                            edge_count += 1
-            dept_density[da][db] = round(edge_count / possible, 3) if possible > 0 else None
-
-    # Bridge nodes
-    btw_threshold = float(np.percentile(betweenness_norm, 75)) if betweenness_norm else 0
-    bridges = []
-    for v in range(g.vcount()):
-        if betweenness_norm[v] < btw_threshold:
-            continue
-        neighbor_comms = set()
-        for neighbor in g.neighbors(v):
-            neighbor_comms.add(membership[neighbor])
-        if len(neighbor_comms) >= 2:
-            bridges.append({
-                "id": ids[v][:8],
-                "department": depts[v],
-                "community": membership[v],
-                "betweenness": round(betweenness_norm[v], 4),
-                "communities_bridged": len(neighbor_comms),
-                "connections": g.degree(v),
-            })
-    bridges.sort(key=lambda x: x["betweenness"], reverse=True)
+        for v, btw in zip(bridge_idx[top].tolist(), top_btw)
+    ]
 
     # Critical edges (top 10 by edge betweenness that cross communities)
-    critical_edges = []
-    for eidx in range(g.ecount()):
-        edge = g.es[eidx]
-        src, tgt = edge.source, edge.target
-        if membership[src] != membership[tgt]:
-            critical_edges.append({
-                "source_dept": depts[src],
-                "target_dept": depts[tgt],
-                "source_community": membership[src],
-                "target_community": membership[tgt],
-                "edge_betweenness": round(edge_btw_norm[eidx], 4),
-                "weight": round(edge["weight"], 4),
-            })
-    critical_edges.sort(key=lambda x: x["edge_betweenness"], reverse=True)
+    cross = np.flatnonzero(memb[src] != memb[dst])
+    top, top_eb = _top_rounded(edge_btw_norm[cross], 10, 4)
+    weights = g.es["weight"]
+    critical_edges = [
+        {
+            "source_dept": depts[src[e]],
+            "target_dept": depts[dst[e]],
+            "source_community": membership[src[e]],
+            "target_community": membership[dst[e]],
+            "edge_betweenness": eb,
+            "weight": round(weights[e], 4),
+        }
+        for e, eb in zip(cross[top].tolist(), top_eb)
+    ]
 
     # Narrative
     narrative = _generate_narrative(
         n_communities, modularity, community_profiles,
-        discriminants, bridges, stability, stability_label,
+        discriminants, len(bridge_idx), stability["nmi"], stability["label"],
+        stability.get("significance"),
     )
 
     return {
@@ -503,33 +1753,50 @@ def compute_ona_metrics(
             "communities": n_communities,
             "modularity": round(modularity, 4),
             "avg_clustering": round(avg_clustering, 4),
+            "graph_mode": g["mode"] if "mode" in g.attributes() else "dense",
+            "kernel": g["kernel"] if "kernel" in g.attributes() else "cosine",
+            **({"knn_k": g["knn_k"]} if "knn_k" in g.attributes() else {}),
         },
         "communities": community_profiles,
         "discriminants": discriminants[:10],
         "department_density": dept_density,
-        "bridges": bridges[:20],
+        "bridges": bridges,
         "global_means": {c: round(v, 3) for c, v in global_means.items()},
         "narrative": narrative,
         "generated_at": datetime.now(timezone.utc).isoformat(),
         # ---- New fields ----
         "stability": {
-            "nmi": round(stability, 4),
-            "label": stability_label,
-            "iterations": STABILITY_ITERATIONS,
-            "method": "leiden",
+            **stability, "nmi": round(stability["nmi"], 4),
+            **({"consensus": consensus} if consensus else {}),
         },
-        "critical_edges": critical_edges[:10],
+        "critical_edges": critical_edges,
+        "centrality": centrality.summary(),
+        "tenure_density": tenure_density,
+        "gender_density": gender_density,
+        # ---- Detail row (see save_results) ----
+        "nodes": nodes,
     }
 
 
 def _generate_narrative(
     n_communities: int, modularity: float,
     communities: list[dict], discriminants: list[dict],
-    bridges: list[dict], stability: float, stability_label: str,
+    n_bridges: int, stability: float, stability_label: str,
+    significance: dict | None = None,
 ) -> str:
     """Template-based narrative (no LLM)."""
     parts: list[str] = []
 
+    # Structure no stronger than in null graphs: say so before anything else
+    if significance and not significance["significant"]:
+        parts.append(
+            f"Nota: La modularidad observada ({significance['observed']:.2f}) no supera de forma "
+            f"significativa a la de redes aleatorias equivalentes (promedio "
+            f"{significance['null_mean']:.2f}, p={significance['p_value']:.2f}). "
+            "Los grupos descritos a continuación pueden ser un artefacto de respuestas "
+            "similares y no deben interpretarse como subculturas diferenciadas."
+        )
+
     # Stability warning first if weak
     if stability_label == "weak":
         parts.append(
@@ -573,9 +1840,9 @@ def _generate_narrative(
             f"percepción más crítica ({worst['avg_score']:.2f})."
         )
 
-    if bridges:
+    if n_bridges:
         parts.append(
-            f"Se identificaron {len(bridges)} nodos puente — personas que "
+            f"Se identificaron {n_bridges} nodos puente — personas que "
             "conectan múltiples comunidades y pueden actuar como traductores "
             "culturales."
         )
@@ -588,69 +1855,264 @@ def _generate_narrative(
     return " ".join(parts)
 
 
+_worker_bootstrap: tuple | None = None  # (X, membership, A, A_intra) in each bootstrap worker
+
+
+def _init_bootstrap_worker(
+    X: np.ndarray, memb: np.ndarray, adjacency: sp.csr_matrix, intra: sp.csr_matrix
+) -> None:
+    global _worker_bootstrap
+    _worker_bootstrap = (X, memb, adjacency, intra)
+
+
+def _bootstrap_batch(
+    seed: tuple[int, int], size: int, data: tuple | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """`size` respondent-bootstrap replicates; return (modularity, means).
+
+    Each replicate draws n row indices with replacement and works on their
+    multiplicities W (size × n) instead of a resampled copy of the data:
+      means      — per community, W[:, members] · X[members] / Σ W[:, members]
+                   (NaN when no member was drawn), shape (size, k, d)
+      modularity — of the fixed partition on the graph where each pair's
+                   similarity counts w_i·w_j times (no edges between copies
+                   of one respondent); strengths are W ∘ (A·Wᵀ)ᵀ, so every
+                   replicate is one sparse-dense product over the edges
+    """
+    X, memb, adjacency, intra = data or _worker_bootstrap
+    n, k = len(memb), int(memb.max()) + 1
+    rng = np.random.default_rng(list(seed))
+    idx = rng.integers(0, n, size=(size, n))
+    W = np.bincount(
+        (idx + np.arange(size)[:, None] * n).ravel(), minlength=size * n
+    ).reshape(size, n).astype(np.float64)
+
+    means = np.empty((size, k, X.shape[1]))
+    for c in range(k):
+        members = np.flatnonzero(memb == c)
+        counts = W[:, members].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[:, c] = (W[:, members] @ X[members]) / counts[:, None]
+
+    strength = W.T * (adjacency @ W.T)  # (n, size)
+    inside = W.T * (intra @ W.T)
+    total = strength.sum(axis=0)
+    by_community = np.zeros((k, size))
+    np.add.at(by_community, memb, strength)
+    modularity = inside.sum(axis=0) / total - ((by_community / total) ** 2).sum(axis=0)
+    return modularity, means
+
+
+def _interval(samples: np.ndarray, confidence: float) -> list:
+    """Percentile interval along axis 0, rounded; None where undefined."""
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        bounds = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+    return np.moveaxis(
+        np.where(np.isnan(bounds), None, np.round(bounds, 3)), 0, -1
+    ).tolist()
+
+
+def bootstrap_intervals(
+    g: ig.Graph, membership: list[int], df: pd.DataFrame, dim_codes: list[str],
+    replicates: int, confidence: float = BOOTSTRAP_CONFIDENCE,
+    seed: int = STABILITY_SEED, workers: int = STABILITY_WORKERS,
+) -> dict:
+    """Respondent-bootstrap percentile intervals for the community profiles.
+
+    The partition and the similarity graph are kept fixed: replicates only
+    resample respondents (see _bootstrap_batch), so no similarity is
+    recomputed and Leiden is not rerun. Replicates are drawn in batches of
+    BOOTSTRAP_BATCH, each from its own seed, which makes the result
+    independent of how batches are spread across workers.
+
+    Returns {"replicates", "confidence", "modularity": [lo, hi],
+    "dimension_scores": k × d [lo, hi], "spread": d [lo, hi]}; spread is
+    the max − min of the community means per dimension.
+    """
+    X = df[dim_codes].to_numpy(dtype=np.float64)
+    memb = np.asarray(membership, dtype=np.int64)
+    n = len(memb)
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    weights = np.asarray(g.es["weight"], dtype=np.float64)
+    src = np.concatenate([edges[:, 0], edges[:, 1]])
+    dst = np.concatenate([edges[:, 1], edges[:, 0]])
+    w = np.concatenate([weights, weights])
+    adjacency = sp.csr_matrix((w, (src, dst)), shape=(n, n))
+    same = memb[src] == memb[dst]
+    intra = sp.csr_matrix((w[same], (src[same], dst[same])), shape=(n, n))
+    data = (X, memb, adjacency, intra)
+
+    sizes = [
+        min(BOOTSTRAP_BATCH, replicates - start)
+        for start in range(0, replicates, BOOTSTRAP_BATCH)
+    ]
+    seeds = [(seed, batch) for batch in range(len(sizes))]
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(
+            min(workers, len(sizes)), initializer=_init_bootstrap_worker, initargs=data
+        ) as pool:
+            results = list(pool.map(_bootstrap_batch, seeds, sizes))
+    else:
+        results = [_bootstrap_batch(x, size, data) for x, size in zip(seeds, sizes)]
+
+    modularity = np.concatenate([q for q, _ in results])
+    means = np.concatenate([m for _, m in results])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        spread = np.nanmax(means, axis=1) - np.nanmin(means, axis=1)
+
+    result = {
+        "replicates": replicates,
+        "confidence": confidence,
+        "modularity": _interval(modularity, confidence),
+        "dimension_scores": _interval(means, confidence),
+        "spread": _interval(spread, confidence),
+    }
+    lo, hi = result["modularity"]
+    print(f"  Bootstrap: {replicates} replicates, modularity {confidence:.0%} CI [{lo}, {hi}]")
+    return result
+
+
+def attach_intervals(metrics: dict, intervals: dict, dim_codes: list[str]) -> None:
+    """Add bootstrap intervals next to the point estimates in `metrics`."""
+    column = {code: j for j, code in enumerate(dim_codes)}
+    for community in metrics["communities"]:
+        ci = intervals["dimension_scores"][community["id"]]
+        community["dimension_ci"] = {
+            code: ci[column[code]] for code in community["dimension_scores"]
+        }
+    for discriminant in metrics["discriminants"]:
+        discriminant["spread_ci"] = intervals["spread"][column[discriminant["code"]]]
+    metrics["bootstrap"] = {
+        "replicates": intervals["replicates"],
+        "confidence": intervals["confidence"],
+        "modularity_ci": intervals["modularity"],
+    }
+
+
 # ---------------------------------------------------------------------------
 # 5. Generate static graph image
 # ---------------------------------------------------------------------------
-def generate_graph_image(
-    g: ig.Graph, membership: list[int]
-) -> str:
-    """Generate PNG graph visualization, return base64 string."""
+def _layout_backbone(g: ig.Graph, k: int) -> ig.Graph:
+    """Subgraph keeping each node's k strongest edges (same vertices)."""
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    weights = np.asarray(g.es["weight"], dtype=np.float64)
+    ends = np.concatenate([edges[:, 0], edges[:, 1]])
+    eids = np.tile(np.arange(len(edges)), 2)
+    order = np.lexsort((-np.tile(weights, 2), ends))
+    first = np.searchsorted(ends[order], np.arange(g.vcount()))
+    rank = np.arange(len(order)) - first[ends[order]]
+    keep = np.unique(eids[order][rank < k])
+    return g.subgraph_edges(keep.tolist(), delete_vertices=False)
+
+
+def compute_layout(
+    g: ig.Graph, previous: dict[str, list[float]] | None = None, seed: int = STABILITY_SEED
+) -> tuple[np.ndarray, str]:
+    """Node coordinates (n, 2) and the layout used to get them.
+
+    Coordinates stored by a previous run (keyed by 8-char respondent id) are
+    reused as-is when they cover every node ("stored"). Otherwise up to
+    LAYOUT_FR_MAX_NODES nodes get the full Fruchterman-Reingold layout;
+    larger graphs use igraph's grid variant (repulsion only between nearby
+    cells) on a backbone of each node's LAYOUT_BACKBONE_K strongest edges.
+    Stored coordinates seed a shorter layout run so returning respondents
+    keep roughly their position.
+    """
+    keys = [rid[:8] for rid in g.vs["respondent_id"]]
+    previous = previous or {}
+    known = [previous.get(k) for k in keys]
+    if known and all(xy is not None for xy in known):
+        return np.asarray(known, dtype=np.float64), "stored"
+
+    init = None
+    if any(xy is not None for xy in known):
+        rng = np.random.default_rng(seed)
+        stored = np.asarray([xy for xy in known if xy is not None], dtype=np.float64)
+        lo, hi = stored.min(axis=0), stored.max(axis=0)
+        init = [xy if xy is not None else rng.uniform(lo, hi).tolist() for xy in known]
+
+    random.seed(seed)
+    niter = 500 if init is None else LAYOUT_WARM_ITERATIONS
+    if g.vcount() <= LAYOUT_FR_MAX_NODES:
+        layout = g.layout("fruchterman_reingold", weights="weight", niter=niter, seed=init)
+        algorithm = "fruchterman_reingold"
+    else:
+        backbone = _layout_backbone(g, LAYOUT_BACKBONE_K)
+        layout = backbone.layout_fruchterman_reingold(
+            weights="weight", niter=niter, seed=init, grid=True
+        )
+        algorithm = "fruchterman_reingold_grid"
+    return np.asarray(layout.coords, dtype=np.float64), algorithm
 
-    n_communities = max(membership) + 1 if membership else 1
 
-    # Assign colors by community
-    colors = []
-    for m in membership:
-        colors.append(CLUSTER_COLORS[m % len(CLUSTER_COLORS)])
-    g.vs["color"] = colors
+def generate_graph_image(
+    g: ig.Graph, membership: list[int], centrality: CentralityCache | None = None,
+    coords: np.ndarray | None = None, seed: int = STABILITY_SEED,
+) -> str:
+    """Generate PNG graph visualization, return base64 string.
 
-    # Size by betweenness (rescale to 15-40)
-    btw = g.betweenness(weights="weight")
-    max_btw = max(btw) if btw and max(btw) > 0 else 1.0
-    g.vs["size"] = [15 + 25 * (b / max_btw) for b in btw]
+    Edges are drawn as one LineCollection; above IMAGE_MAX_EDGES edges all
+    inter-community edges are kept and intra-community ones are sampled.
+    """
+    import matplotlib
+    matplotlib.use("Agg")  # non-interactive backend
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import to_rgba, to_rgba_array
+
+    memb = np.asarray(membership, dtype=np.int64)
+    n_communities = int(memb.max()) + 1 if len(memb) else 1
+    if coords is None:
+        coords, _ = compute_layout(g, seed=seed)
+
+    # Node color by community, size by betweenness (rescale to 15-40)
+    palette = to_rgba_array(CLUSTER_COLORS)
+    btw = np.asarray((centrality or CentralityCache(g)).betweenness())
+    max_btw = btw.max() if len(btw) and btw.max() > 0 else 1.0
+    sizes = 15 + 25 * (btw / max_btw)
 
     # Edge styling: intra-community = community color (light), inter = gray
-    edge_colors = []
-    edge_widths = []
-    for edge in g.es:
-        src_comm = membership[edge.source]
-        tgt_comm = membership[edge.target]
-        if src_comm == tgt_comm:
-            base_color = CLUSTER_COLORS[src_comm % len(CLUSTER_COLORS)]
-            edge_colors.append(base_color + "40")  # alpha
-            edge_widths.append(0.3)
-        else:
-            edge_colors.append("#94a3b888")
-            edge_widths.append(0.5)
-    g.es["color"] = edge_colors
-    g.es["width"] = edge_widths
-
-    # Layout: Fruchterman-Reingold (best for community structure visualization)
-    layout = g.layout("fruchterman_reingold", weights="weight", niter=500)
+    edges = np.asarray(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    intra = memb[edges[:, 0]] == memb[edges[:, 1]]
+    if len(edges) > IMAGE_MAX_EDGES:
+        intra_idx = np.flatnonzero(intra)
+        budget = max(IMAGE_MAX_EDGES - int((~intra).sum()), 0)
+        if budget < len(intra_idx):
+            keep = ~intra
+            keep[np.random.default_rng(seed).choice(intra_idx, budget, replace=False)] = True
+            edges, intra = edges[keep], intra[keep]
+    edge_colors = np.empty((len(edges), 4))
+    edge_colors[:] = to_rgba("#94a3b888")
+    intra_rgba = to_rgba_array([c + "40" for c in CLUSTER_COLORS])  # alpha
+    edge_colors[intra] = intra_rgba[memb[edges[intra, 0]] % len(CLUSTER_COLORS)]
+    edge_widths = np.where(intra, 0.3, 0.5)
 
-    # Plot with matplotlib backend
     fig, ax = plt.subplots(figsize=(10, 10))
     fig.patch.set_facecolor("white")
 
-    ig.plot(
-        g,
-        target=ax,
-        layout=layout,
-        vertex_label=None,  # no labels for anonymity
-        vertex_frame_color="white",
-        vertex_frame_width=1.0,
-        edge_curved=0.1,
-    )
+    ax.add_collection(LineCollection(
+        coords[edges], colors=edge_colors, linewidths=edge_widths, zorder=1
+    ))
+    ax.scatter(
+        coords[:, 0], coords[:, 1], s=sizes**2 / 6,
+        c=palette[memb % len(CLUSTER_COLORS)],
+        edgecolors="white", linewidths=1.0, zorder=2,
+    )  # no labels for anonymity
+    ax.set_aspect("equal")
+    ax.autoscale_view()
 
     # Legend
+    counts = np.bincount(memb, minlength=n_communities)
     legend_handles = []
     for i in range(n_communities):
-        count = membership.count(i)
         handle = ax.scatter(
             [], [], s=80,
             facecolor=CLUSTER_COLORS[i % len(CLUSTER_COLORS)],
             edgecolor="white", linewidth=0.5,
-            label=f"Grupo {i+1} ({count})"
+            label=f"Grupo {i+1} ({counts[i]})"
         )
         legend_handles.append(handle)
     ax.legend(
@@ -677,72 +2139,1132 @@ def generate_graph_image(
 
 
 # ---------------------------------------------------------------------------
-# 6. Save results
+# 6. Save results and data sources
 # ---------------------------------------------------------------------------
-def save_results(sb: Client, campaign_id: str, data: dict) -> None:
+def save_results(sb: Client, campaign_id: str, data: dict, detail: dict) -> None:
+    """Store the summary and the detail as two campaign_analytics rows.
+
+    ona_network holds the small summary every dashboard read needs;
+    ona_network_detail holds the graph image and the columnar node table
+    (metrics, consensus, coordinates), fetched only on demand.
+    """
     sb.table("campaign_analytics").delete().eq(
         "campaign_id", campaign_id
-    ).eq("analysis_type", "ona_network").execute()
+    ).in_("analysis_type", ["ona_network", "ona_network_detail"]).execute()
 
-    sb.table("campaign_analytics").insert({
-        "campaign_id": campaign_id,
-        "analysis_type": "ona_network",
-        "data": data,
-    }).execute()
+    sb.table("campaign_analytics").insert([
+        {"campaign_id": campaign_id, "analysis_type": "ona_network", "data": data},
+        {"campaign_id": campaign_id, "analysis_type": "ona_network_detail", "data": detail},
+    ]).execute()
     print(f"  Saved ONA results for campaign {campaign_id}")
 
 
+def load_layout(sb: Client, campaign_id: str) -> dict[str, list[float]]:
+    """Node coordinates saved by the previous run, keyed by 8-char id."""
+    res = _execute(
+        lambda: sb.table("campaign_analytics")
+        .select("nodes:data->nodes")
+        .eq("campaign_id", campaign_id)
+        .eq("analysis_type", "ona_network_detail")
+        .limit(1)
+    )
+    return _layout_from_nodes(res.data[0].get("nodes") if res.data else None)
+
+
+def _layout_from_nodes(nodes: dict | None) -> dict[str, list[float]]:
+    if not nodes or "x" not in nodes:
+        return {}
+    return {k: [x, y] for k, x, y in zip(nodes["id"], nodes["x"], nodes["y"])}
+
+
+class DataSource(Protocol):
+    """Where campaigns are read from and results written to."""
+
+    def campaign_ids(self) -> list[str]: ...
+
+    def fetch(
+        self, campaign_id: str, opts: ONAOptions
+    ) -> tuple[pd.DataFrame, list[str]] | None: ...
+
+    def input_fingerprint(self, campaign_id: str, opts: ONAOptions) -> str | None: ...
+
+    def stored_fingerprint(self, campaign_id: str) -> str | None: ...
+
+    def load_layout(self, campaign_id: str) -> dict[str, list[float]]: ...
+
+    def save(self, campaign_id: str, data: dict, detail: dict) -> None: ...
+
+    def person_keys(self, campaign_id: str) -> dict[str, str]: ...
+
+    def previous_communities(self, campaign_id: str) -> tuple[str, dict[str, int]] | None: ...
+
+
+def _person_key(email: str) -> str:
+    """Pseudonymous id linking one person's respondents across campaigns.
+
+    HMAC-SHA256 keyed by ONA_PERSON_KEY_SECRET, so hashing a list of
+    employee emails does not reveal whose respondent is whose.
+    """
+    if not PERSON_KEY_SECRET:
+        raise RuntimeError("ONA_PERSON_KEY_SECRET is not set")
+    return hmac.new(
+        PERSON_KEY_SECRET.encode(), email.strip().lower().encode(), hashlib.sha256
+    ).hexdigest()[:16]
+
+
+def _communities_by_person(nodes: dict, keys: dict[str, str]) -> dict[str, int]:
+    """person key -> community from a stored node table.
+
+    Results keep only 8-char display ids, so a prefix shared by two
+    respondents (among the participants or in the table) is ambiguous and
+    left unmatched rather than guessed.
+    """
+    shared = Counter(rid[:8] for rid in keys) + Counter(nodes["id"])
+    by_prefix = {rid[:8]: key for rid, key in keys.items()}
+    return {
+        by_prefix[i]: c
+        for i, c in zip(nodes["id"], nodes["community"])
+        if i in by_prefix and shared[i] == 2
+    }
+
+
+class SupabaseSource:
+    """The live database: campaign_analytics rows, metadata via InstrumentCache."""
+
+    def __init__(self, sb: Client, instruments: InstrumentCache | None = None):
+        self.sb = sb
+        self.instruments = instruments or InstrumentCache()
+
+    def campaign_ids(self) -> list[str]:
+        """Closed and archived campaigns, oldest first."""
+        camps = _execute(
+            lambda: self.sb.table("campaigns")
+            .select("id")
+            .in_("status", ["closed", "archived"])
+            .order("created_at")
+        )
+        return [c["id"] for c in camps.data or []]
+
+    def fetch(
+        self, campaign_id: str, opts: ONAOptions
+    ) -> tuple[pd.DataFrame, list[str]] | None:
+        return fetch_campaign_data(
+            self.sb, campaign_id, pushdown=opts.pushdown, instruments=self.instruments
+        )
+
+    def input_fingerprint(self, campaign_id: str, opts: ONAOptions) -> str | None:
+        return input_fingerprint(self.sb, campaign_id, opts)
+
+    def stored_fingerprint(self, campaign_id: str) -> str | None:
+        return stored_fingerprint(self.sb, campaign_id)
+
+    def load_layout(self, campaign_id: str) -> dict[str, list[float]]:
+        return load_layout(self.sb, campaign_id)
+
+    def save(self, campaign_id: str, data: dict, detail: dict) -> None:
+        save_results(self.sb, campaign_id, data, detail)
+
+    def campaign_info(self, campaign_id: str) -> dict | None:
+        res = _execute(
+            lambda: self.sb.table("campaigns")
+            .select("organization_id, created_at")
+            .eq("id", campaign_id)
+            .single()
+        )
+        return res.data
+
+    def person_keys(self, campaign_id: str) -> dict[str, str]:
+        """respondent_id -> person key, for respondents invited as participants."""
+        rows = _fetch_all(
+            lambda: self.sb.table("participants")
+            .select("id, respondent_id, email")
+            .eq("campaign_id", campaign_id)
+        )
+        return {
+            r["respondent_id"]: _person_key(r["email"])
+            for r in rows if r.get("respondent_id") and r.get("email")
+        }
+
+    def previous_communities(self, campaign_id: str) -> tuple[str, dict[str, int]] | None:
+        """(campaign id, person key -> community) of the organisation's latest
+        earlier campaign with a stored ONA result, searching the last
+        LONGITUDINAL_LOOKBACK closed or archived ones."""
+        info = self.campaign_info(campaign_id)
+        if not info:
+            return None
+        earlier = _execute(
+            lambda: self.sb.table("campaigns")
+            .select("id")
+            .eq("organization_id", info["organization_id"])
+            .lt("created_at", info["created_at"])
+            .in_("status", ["closed", "archived"])
+            .order("created_at", desc=True)
+            .limit(LONGITUDINAL_LOOKBACK)
+        )
+        candidates = [c["id"] for c in earlier.data or []]
+        if not candidates:
+            return None
+        analysed = _execute(
+            lambda: self.sb.table("campaign_analytics")
+            .select("campaign_id")
+            .in_("campaign_id", candidates)
+            .eq("analysis_type", "ona_network_detail")
+        )
+        done = {r["campaign_id"] for r in analysed.data or []}
+        previous_id = next((cid for cid in candidates if cid in done), None)
+        if previous_id is None:
+            return None
+        res = _execute(
+            lambda: self.sb.table("campaign_analytics")
+            .select("id:data->nodes->id, community:data->nodes->community")
+            .eq("campaign_id", previous_id)
+            .eq("analysis_type", "ona_network_detail")
+            .limit(1)
+        )
+        nodes = res.data[0] if res.data else None
+        if not nodes or not nodes.get("id"):
+            return None
+        return previous_id, _communities_by_person(nodes, self.person_keys(previous_id))
+
+
+class SnapshotSource:
+    """Campaigns exported to a local directory, one subdirectory each:
+
+        vectors.arrow            respondent vectors (Arrow IPC, memory-mapped)
+        campaign.json            dim_codes and export time
+        ona_network.json         summary, as in campaign_analytics
+        ona_network_detail.json  graph image, layout and node table
+
+    Reads need no network, so parameter sweeps rerun at local-disk speed.
+    There is no input checksum: the fingerprint falls back to the vectors.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, campaign_id: str, name: str) -> str:
+        return os.path.join(self.directory, campaign_id, name)
+
+    def _read_json(self, campaign_id: str, name: str) -> dict | None:
+        try:
+            with open(self._path(campaign_id, name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def campaign_ids(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            e.name for e in os.scandir(self.directory)
+            if os.path.exists(os.path.join(e.path, "vectors.arrow"))
+        )
+
+    def fetch(
+        self, campaign_id: str, opts: ONAOptions
+    ) -> tuple[pd.DataFrame, list[str]] | None:
+        import pyarrow as pa
+
+        meta = self._read_json(campaign_id, "campaign.json")
+        if meta is None:
+            print(f"  Campaign {campaign_id} not in snapshot {self.directory}")
+            return None
+        with pa.memory_map(self._path(campaign_id, "vectors.arrow")) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+        dim_codes = meta["dim_codes"]
+        print(f"  Vectors: {len(df)} respondents × {len(dim_codes)} dimensions (snapshot)")
+        return df, dim_codes
+
+    def write_vectors(
+        self,
+        campaign_id: str,
+        df: pd.DataFrame,
+        dim_codes: list[str],
+        info: dict | None = None,
+        people: dict[str, str] | None = None,
+    ) -> None:
+        """Store fetch_campaign_data output; uncompressed so reads can mmap it.
+
+        `info` (organization_id, created_at) and `people` (respondent_id ->
+        person key) let longitudinal runs find and match earlier snapshots.
+        `people` is left out unless given: it links survey vectors to people.
+        """
+        import pyarrow as pa
+
+        os.makedirs(os.path.join(self.directory, campaign_id), exist_ok=True)
+        path = self._path(campaign_id, "vectors.arrow")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(f"{path}.{os.getpid()}.tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        _write_json(
+            self._path(campaign_id, "campaign.json"),
+            {
+                "campaign_id": campaign_id,
+                "dim_codes": dim_codes,
+                "exported_at": datetime.now(timezone.utc).isoformat(),
+                **(info or {}),
+                **({"people": people} if people is not None else {}),
+            },
+        )
+
+    def input_fingerprint(self, campaign_id: str, opts: ONAOptions) -> str | None:
+        return None
+
+    def stored_fingerprint(self, campaign_id: str) -> str | None:
+        data = self._read_json(campaign_id, "ona_network.json")
+        return data.get("input_fingerprint") if data else None
+
+    def load_layout(self, campaign_id: str) -> dict[str, list[float]]:
+        detail = self._read_json(campaign_id, "ona_network_detail.json")
+        return _layout_from_nodes(detail.get("nodes") if detail else None)
+
+    def save(self, campaign_id: str, data: dict, detail: dict) -> None:
+        os.makedirs(os.path.join(self.directory, campaign_id), exist_ok=True)
+        _write_json(self._path(campaign_id, "ona_network.json"), data)
+        _write_json(self._path(campaign_id, "ona_network_detail.json"), detail)
+        print(f"  Saved ONA results to {os.path.join(self.directory, campaign_id)}")
+
+    def person_keys(self, campaign_id: str) -> dict[str, str]:
+        meta = self._read_json(campaign_id, "campaign.json") or {}
+        return meta.get("people", {})
+
+    def previous_communities(self, campaign_id: str) -> tuple[str, dict[str, int]] | None:
+        """Latest earlier snapshot of the same organisation with results."""
+        meta = self._read_json(campaign_id, "campaign.json") or {}
+        if not meta.get("organization_id"):
+            return None
+        earlier = []
+        for cid in self.campaign_ids():
+            other = self._read_json(cid, "campaign.json") or {}
+            if (
+                other.get("organization_id") == meta["organization_id"]
+                and other.get("created_at", "") < meta.get("created_at", "")
+                and os.path.exists(self._path(cid, "ona_network_detail.json"))
+            ):
+                earlier.append((other["created_at"], cid))
+        if not earlier:
+            return None
+        previous_id = max(earlier)[1]
+        detail = self._read_json(previous_id, "ona_network_detail.json")
+        return previous_id, _communities_by_person(detail["nodes"], self.person_keys(previous_id))
+
+
+def open_source(opts: ONAOptions) -> DataSource:
+    """The snapshot named in opts, or a new Supabase client."""
+    if opts.snapshot:
+        return SnapshotSource(opts.snapshot)
+    return SupabaseSource(get_supabase(), get_instrument_cache(opts.instrument_cache))
+
+
+def export_snapshot(
+    source: SupabaseSource,
+    snapshot: SnapshotSource,
+    campaign_id: str,
+    opts: ONAOptions,
+    people: bool = False,
+) -> bool:
+    """Copy one campaign's vectors into a snapshot; False if it has no data.
+
+    With `people` the respondents' person keys are copied too, so
+    --longitudinal can run on the snapshot.
+    """
+    print(f"\n=== Snapshot export: {campaign_id} ===")
+    result = source.fetch(campaign_id, opts)
+    if result is None:
+        return False
+    df, dim_codes = result
+    keys = None
+    if people:
+        kept = set(df["_id"])
+        keys = {rid: key for rid, key in source.person_keys(campaign_id).items() if rid in kept}
+    snapshot.write_vectors(campaign_id, df, dim_codes, source.campaign_info(campaign_id), keys)
+    return True
+
+
 # ---------------------------------------------------------------------------
 # 7. Main
 # ---------------------------------------------------------------------------
-def process_campaign(sb: Client, campaign_id: str) -> None:
+def _cpu_seconds() -> float:
+    """CPU time of this process plus its reaped children (the Leiden pool)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark (Linux); False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _children_rusage() -> tuple[float, float]:
+    """(CPU seconds, peak RSS MB) of reaped child processes (the Leiden pool).
+
+    The peak is the kernel's high-water mark of the largest single child
+    since this process started; it can't be reset per stage.
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    unit = 2**20 if sys.platform == "darwin" else 2**10  # ru_maxrss: bytes vs KB
+    return children.ru_utime + children.ru_stime, children.ru_maxrss / unit
+
+
+def _peak_rss_mb() -> float:
+    """High-water RSS of this process only (Linux); children are not included."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class StageTimings:
+    """Wall time, CPU time, peak RSS and sizes of each pipeline stage.
+
+    `stage(name)` yields the stage's record so the caller can add sizes
+    (n, edges, communities). peak_rss_mb is this process's peak in the
+    stage where the high-water mark can be reset (Linux) and omitted
+    elsewhere; it leaves out pool processes. A stage that reaps children
+    also records children_peak_rss_mb, the largest child so far. With
+    `profile` set to a stage name, that stage also runs under cProfile and
+    tracemalloc and both are written to `profile_dir`.
+    """
+
+    def __init__(
+        self,
+        campaign_id: str = "",
+        log_json: bool = False,
+        profile: str | None = None,
+        profile_dir: str = ".",
+    ):
+        self.campaign_id = campaign_id
+        self.log_json = log_json
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.stages: dict[str, dict] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        record: dict = {}
+        profiler = cProfile.Profile() if name == self.profile else None
+        if profiler:
+            tracemalloc.start()
+            profiler.enable()
+        resettable = _reset_peak_rss()
+        start, cpu = time.perf_counter(), _cpu_seconds()
+        children_cpu = _children_rusage()[0]
+        try:
+            yield record
+        finally:
+            record.update(
+                seconds=round(time.perf_counter() - start, 3),
+                cpu_seconds=round(_cpu_seconds() - cpu, 3),
+            )
+            if resettable:
+                record["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+            reaped_cpu, children_peak = _children_rusage()
+            if reaped_cpu > children_cpu and children_peak > 0:
+                record["children_peak_rss_mb"] = round(children_peak, 1)
+            if profiler:
+                profiler.disable()
+                record["alloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                self._dump_profile(name, profiler, tracemalloc.take_snapshot())
+                tracemalloc.stop()
+            self.stages[name] = record
+            if self.log_json:
+                event = {"event": "stage", "campaign_id": self.campaign_id, "stage": name}
+                print(json.dumps({**event, **record}), file=sys.stderr, flush=True)
+
+    def _dump_profile(
+        self, name: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot
+    ) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"ona-{self.campaign_id[:8]}-{name}")
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.alloc.txt", "w") as f:
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+        print(f"  Profile of {name}: {base}.prof, {base}.alloc.txt")
+
+    def summary(self) -> dict:
+        """Compact block stored with the result."""
+        return {
+            "total_seconds": round(sum(r["seconds"] for r in self.stages.values()), 3),
+            "stages": dict(self.stages),
+        }
+
+    def line(self) -> str:
+        """One human-readable line: seconds per stage and the overall peaks."""
+        parts = ", ".join(f"{k} {r['seconds']:.2f}s" for k, r in self.stages.items())
+        peak = max((r.get("peak_rss_mb", 0) for r in self.stages.values()), default=0)
+        child = max((r.get("children_peak_rss_mb", 0) for r in self.stages.values()), default=0)
+        peaks = [f"peak {peak:.0f} MB"] if peak else []
+        peaks += [f"pool process {child:.0f} MB"] if child else []
+        return f"{parts} ({', '.join(peaks)})" if peaks else parts
+
+
+def process_campaign(
+    source: DataSource, campaign_id: str, opts: ONAOptions | None = None
+) -> str:
+    """Analyse one campaign; return "ok", "unchanged", "no_data" or "no_edges"."""
+    opts = opts or ONAOptions()
     print(f"\n=== ONA Analysis: {campaign_id} ===")
-    result = fetch_campaign_data(sb, campaign_id)
+    timings = StageTimings(campaign_id, opts.log_json, opts.profile_stage, opts.profile_dir)
+
+    # Longitudinal inputs: the prior campaign, its stored result and the
+    # community each returning respondent comes from. They shape the result
+    # too, so they are looked up first and chained into the fingerprint.
+    returning: dict[str, int] = {}
+    lineage = previous_id = None
+    if opts.longitudinal:
+        with timings.stage("longitudinal") as info:
+            prior = source.previous_communities(campaign_id)
+            if prior is not None:
+                previous_id, by_person = prior
+                returning = {
+                    rid: by_person[key]
+                    for rid, key in source.person_keys(campaign_id).items() if key in by_person
+                }
+                lineage = _lineage_digest(
+                    previous_id, source.stored_fingerprint(previous_id), returning
+                )
+                info["returning"] = len(returning)
+
+    # Skip campaigns whose inputs and parameters match the stored result
+    with timings.stage("fingerprint"):
+        stored = None if opts.force else source.stored_fingerprint(campaign_id)
+        fingerprint = _chain_fingerprint(source.input_fingerprint(campaign_id, opts), lineage)
+    if stored and fingerprint == stored:
+        print("  Inputs unchanged since last analysis — skipping (--force to rerun)")
+        return "unchanged"
+
+    with timings.stage("fetch") as info:
+        result = source.fetch(campaign_id, opts)
+        if result is not None:
+            info["n"] = len(result[0])
     if result is None:
-        return
+        return "no_data"
     df, dim_codes = result
+    if fingerprint is None:
+        fingerprint = _chain_fingerprint(vectors_fingerprint(df, dim_codes, opts), lineage)
+        if stored and fingerprint == stored:
+            print("  Vectors unchanged since last analysis — skipping (--force to rerun)")
+            return "unchanged"
+
+    # Previous community of each returning respondent (-1 for newcomers)
+    previous = None
+    if opts.longitudinal:
+        if previous_id is None:
+            print("  Longitudinal: no earlier ONA result for this organisation")
+        else:
+            previous = np.array([returning.get(rid, -1) for rid in df["_id"]])
+            print(f"  Longitudinal: {int((previous >= 0).sum())}/{len(df)} respondents "
+                  f"returning from {previous_id}")
 
-    g = build_similarity_graph(df, dim_codes)
+    with timings.stage("graph") as info:
+        g = build_similarity_graph(
+            df, dim_codes, mode=opts.graph_mode, kernel=opts.kernel, dtype=opts.dtype
+        )
+        info.update(n=g.vcount(), edges=g.ecount())
     if g.ecount() == 0:
         print("  No edges — skipping")
-        return
+        return "no_edges"
 
     # Community detection with stability analysis
-    partition, stability, stability_label = detect_communities_with_stability(g)
+    with timings.stage("communities") as info:
+        partition, stability = detect_communities_with_stability(
+            g, n_iterations=opts.stability_iterations, seed=opts.seed, workers=opts.workers,
+            initial_membership=None if previous is None else warm_start_membership(previous),
+        )
+        info.update(communities=len(partition), runs=stability["iterations"])
+
+    # Is the modularity above what structureless graphs reach?
+    if opts.null_models:
+        with timings.stage("significance") as info:
+            stability["significance"] = null_model_significance(
+                g, opts.null_models, opts.null_model,
+                df[dim_codes].to_numpy(dtype=opts.dtype), opts.dtype,
+                seed=opts.seed, workers=opts.workers,
+            )
+            info["runs"] = opts.null_models
+
+    # Coarser/finer partitions of the same graph for the dashboard
+    sweep = None
+    if opts.resolutions:
+        with timings.stage("sweep") as info:
+            sweep, sweep_memberships = resolution_sweep(
+                g, opts.resolutions, opts.resolution_objective,
+                seed=opts.seed, workers=opts.workers,
+            )
+            info["levels"] = len(sweep["levels"])
+
+    # Centralities are computed once and shared by metrics and image
+    with timings.stage("centrality"):
+        centrality = CentralityCache(
+            g, mode=opts.centrality, samples=opts.betweenness_samples, seed=opts.seed
+        )
+        centrality.betweenness()
+        centrality.edge_betweenness()
+        centrality.eigenvector()
+    if centrality.mode == "approx":
+        bound = centrality.summary()["error_bound"]
+        print(f"  Centrality: approx ({len(centrality.sources)} sampled sources, ±{bound})")
 
     # Compute all metrics
-    metrics = compute_ona_metrics(
-        g, partition, stability, stability_label, df, dim_codes
+    with timings.stage("metrics"):
+        metrics = compute_ona_metrics(
+            g, partition, stability, df, dim_codes, centrality
+        )
+    if opts.bootstrap:
+        with timings.stage("bootstrap") as info:
+            intervals = bootstrap_intervals(
+                g, partition.membership, df, dim_codes, opts.bootstrap,
+                seed=opts.seed, workers=opts.workers,
+            )
+            attach_intervals(metrics, intervals, dim_codes)
+            info["replicates"] = opts.bootstrap
+
+    # Layout (reusing stored coordinates when possible) and graph image
+    with timings.stage("layout"):
+        coords, algorithm = compute_layout(g, source.load_layout(campaign_id), seed=opts.seed)
+    with timings.stage("image"):
+        graph_image_b64 = generate_graph_image(
+            g, partition.membership, centrality, coords, seed=opts.seed
+        )
+    if previous is not None:
+        metrics["longitudinal"] = community_transitions(
+            previous, partition.membership, previous_id
+        )
+    if sweep is not None:
+        metrics["resolution_sweep"] = sweep
+    metrics["input_fingerprint"] = fingerprint
+    metrics["timings"] = timings.summary()  # everything but the save itself
+    detail = {
+        "graph_image": graph_image_b64,
+        "layout": algorithm,
+        "nodes": {
+            **metrics.pop("nodes"),
+            "x": [round(x, 4) for x in coords[:, 0].tolist()],
+            "y": [round(y, 4) for y in coords[:, 1].tolist()],
+        },
+    }
+    if sweep is not None:
+        detail["nodes"]["sweep"] = sweep_memberships  # one membership per level
+
+    with timings.stage("save"):
+        source.save(campaign_id, metrics, detail)
+    print(f"  Timings: {timings.line()}")
+    return "ok"
+
+
+@dataclass
+class CampaignRun:
+    """Outcome of one campaign in a batch run."""
+
+    campaign_id: str
+    status: str
+    seconds: float
+    error: str = ""
+
+
+_batch_source: DataSource | None = None
+
+
+def _init_batch_worker(opts: ONAOptions) -> None:
+    """Pool initializer: one data source (Supabase client) per worker process."""
+    global _batch_source
+    _batch_source = open_source(opts)
+
+
+def _run_campaign(
+    campaign_id: str, opts: ONAOptions, source: DataSource | None = None
+) -> CampaignRun:
+    """process_campaign with timing; an exception fails only this campaign."""
+    start = time.perf_counter()
+    try:
+        status = process_campaign(source or _batch_source, campaign_id, opts)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        print(f"  ERROR ({campaign_id}): {error}")
+        return CampaignRun(campaign_id, "error", time.perf_counter() - start, error)
+    return CampaignRun(campaign_id, status, time.perf_counter() - start)
+
+
+def run_batch(
+    source: DataSource,
+    campaign_ids: list[str],
+    opts: ONAOptions,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> list[CampaignRun]:
+    """Analyse campaigns, up to `concurrency` at once in worker processes.
+
+    Cores are split between campaigns and each campaign's Leiden pool. A
+    worker that dies (e.g. out of memory) fails only its own campaign.
+    """
+    if concurrency <= 1 or len(campaign_ids) <= 1:
+        return [_run_campaign(cid, opts, source) for cid in campaign_ids]
+
+    opts = replace(opts, workers=max(1, opts.workers // concurrency))
+    runs: dict[str, CampaignRun] = {}
+    with ProcessPoolExecutor(
+        concurrency, initializer=_init_batch_worker, initargs=(opts,)
+    ) as pool:
+        futures = {pool.submit(_run_campaign, cid, opts): cid for cid in campaign_ids}
+        for future in as_completed(futures):
+            cid = futures[future]
+            try:
+                runs[cid] = future.result()
+            except Exception as exc:
+                runs[cid] = CampaignRun(cid, "error", 0.0, f"{type(exc).__name__}: {exc}")
+    return [runs[cid] for cid in campaign_ids]
+
+
+def print_batch_summary(runs: list[CampaignRun]) -> None:
+    """Final table: time and status of every campaign."""
+    width = max(len(r.campaign_id) for r in runs)
+    print(f"\n{'Campaign':<{width}}  {'Status':<9}  {'Time':>8}  Error")
+    for r in runs:
+        print(f"{r.campaign_id:<{width}}  {r.status:<9}  {r.seconds:>7.1f}s  {r.error}")
+    counts: dict[str, int] = {}
+    for r in runs:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    total = sum(r.seconds for r in runs)
+    print(
+        f"{len(runs)} campaigns, {total:.1f}s of analysis: "
+        + ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
     )
 
-    # Generate graph image
-    graph_image_b64 = generate_graph_image(g, partition.membership)
-    metrics["graph_image"] = graph_image_b64
 
-    save_results(sb, campaign_id, metrics)
+@dataclass
+class Job:
+    """One claimed row of the ona_jobs queue."""
+
+    id: str
+    campaign_id: str
+    attempts: int = 1
+
+
+class JobQueue(Protocol):
+    """Where run_worker takes campaigns from and records their outcome."""
+
+    def claim(self, worker: str) -> Job | None: ...
+
+    def finish(self, job: Job, run: CampaignRun) -> None: ...
+
+    def heartbeat(self, jobs: list[Job]) -> None: ...
+
+
+class SupabaseQueue:
+    """The ona_jobs table (migrations 000023 and 000025), filled by enqueue_ona_job.
+
+    claim_ona_job locks rows with FOR UPDATE SKIP LOCKED, so any number of
+    workers can share the queue. A running job whose heartbeat is older than
+    WORKER_STALE_SECONDS (its worker died) is handed out again, or marked
+    failed once it has used WORKER_MAX_ATTEMPTS claims.
+    """
+
+    def __init__(self, sb: Client):
+        self.sb = sb
+
+    def claim(self, worker: str) -> Job | None:
+        rows = _execute(lambda: self.sb.rpc("claim_ona_job", {
+            "p_worker": worker,
+            "p_stale_after": f"{WORKER_STALE_SECONDS} seconds",
+            "p_max_attempts": WORKER_MAX_ATTEMPTS,
+        })).data or []
+        if not rows:
+            return None
+        return Job(rows[0]["id"], rows[0]["campaign_id"], rows[0]["attempts"])
+
+    def finish(self, job: Job, run: CampaignRun) -> None:
+        _execute(lambda: self.sb.table("ona_jobs").update({
+            "status": "failed" if run.status == "error" else "done",
+            "result": run.status,
+            "error": run.error or None,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(run.seconds, 3),
+        }).eq("id", job.id).eq("attempts", job.attempts))
+
+    def heartbeat(self, jobs: list[Job]) -> None:
+        _execute(lambda: self.sb.table("ona_jobs").update({
+            "heartbeat_at": datetime.now(timezone.utc).isoformat(),
+        }).in_("id", [job.id for job in jobs]).eq("status", "running"))
+
+
+class MemoryQueue:
+    """In-process stand-in for ona_jobs (tests, --snapshot workers).
+
+    Rows are dicts with the table's columns; a finished job keeps its
+    status, result and duration in `jobs`.
+    """
+
+    def __init__(self, campaign_ids: list[str] | tuple[str, ...] = ()):
+        self.jobs: dict[str, dict] = {}
+        self._queued: deque[str] = deque()
+        self._lock = threading.Lock()
+        for campaign_id in campaign_ids:
+            self.enqueue(campaign_id)
+
+    def enqueue(self, campaign_id: str) -> str:
+        """Queue a campaign unless it is already waiting; return the job id."""
+        with self._lock:
+            for job_id in self._queued:
+                if self.jobs[job_id]["campaign_id"] == campaign_id:
+                    return job_id
+            job_id = f"job-{len(self.jobs) + 1}"
+            self.jobs[job_id] = {
+                "id": job_id, "campaign_id": campaign_id, "status": "queued",
+                "attempts": 0, "worker": None, "result": None, "error": None,
+                "enqueued_at": time.time(), "started_at": None, "heartbeat_at": None,
+                "finished_at": None, "duration_seconds": None,
+            }
+            self._queued.append(job_id)
+            return job_id
+
+    def claim(self, worker: str) -> Job | None:
+        with self._lock:
+            if not self._queued:
+                return None
+            row = self.jobs[self._queued.popleft()]
+            row.update(status="running", worker=worker, started_at=time.time(),
+                       heartbeat_at=time.time(), attempts=row["attempts"] + 1)
+            return Job(row["id"], row["campaign_id"], row["attempts"])
+
+    def finish(self, job: Job, run: CampaignRun) -> None:
+        with self._lock:
+            self.jobs[job.id].update(
+                status="failed" if run.status == "error" else "done",
+                result=run.status, error=run.error or None,
+                finished_at=time.time(), duration_seconds=round(run.seconds, 3),
+            )
+
+    def heartbeat(self, jobs: list[Job]) -> None:
+        with self._lock:
+            for job in jobs:
+                self.jobs[job.id]["heartbeat_at"] = time.time()
+
+
+def run_worker(
+    queue: JobQueue,
+    opts: ONAOptions,
+    concurrency: int = BATCH_CONCURRENCY,
+    poll: float = WORKER_POLL_SECONDS,
+    drain: bool = False,
+) -> list[CampaignRun]:
+    """Process queued campaigns until stopped (or, with drain, until empty).
+
+    Campaigns run in a pool of `concurrency` long-lived processes that keep
+    their imports and data source (Supabase client) between jobs, so a job
+    costs only the analysis. Up to `concurrency` jobs are claimed at once;
+    the queue is polled every `poll` seconds while idle and running jobs get
+    a heartbeat every WORKER_HEARTBEAT_SECONDS. SIGTERM/SIGINT stop claiming
+    and let running jobs finish. A process that dies (e.g. out of memory)
+    fails its job and the pool is replaced. Outcomes the queue can't take
+    (transient errors) are kept and retried like failed claims.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    opts = replace(opts, workers=max(1, opts.workers // max(1, concurrency)))
+    stop = threading.Event()
+    previous_handlers = {
+        sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGTERM, signal.SIGINT)
+    }
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            concurrency, initializer=_init_batch_worker, initargs=(opts,)
+        )
+
+    print(f"ONA worker {worker}: up to {concurrency} jobs at once")
+    pool = new_pool()
+    inflight: dict[Future, tuple[Job, float]] = {}
+    unrecorded: deque[tuple[Job, CampaignRun]] = deque()
+    runs: list[CampaignRun] = []
+    last_beat = time.monotonic()
+    try:
+        while True:
+            while unrecorded:
+                job, run = unrecorded[0]
+                try:
+                    queue.finish(job, run)
+                except Exception as exc:
+                    print(f"  Queue unavailable ({type(exc).__name__}: {exc}); "
+                          f"retrying job {job.id}")
+                    break
+                unrecorded.popleft()
+
+            while not stop.is_set() and len(inflight) < concurrency:
+                try:
+                    job = queue.claim(worker)
+                except Exception as exc:
+                    print(f"  Queue unavailable ({type(exc).__name__}: {exc}); retrying")
+                    break
+                if job is None:
+                    break
+                print(f"Job {job.id}: campaign {job.campaign_id} (attempt {job.attempts})")
+                future = pool.submit(_run_campaign, job.campaign_id, opts)
+                inflight[future] = (job, time.perf_counter())
+
+            if not inflight:
+                if stop.is_set() or (drain and not unrecorded):
+                    break
+                stop.wait(poll)
+                continue
+
+            done, _ = wait(
+                inflight, timeout=min(poll, WORKER_HEARTBEAT_SECONDS), return_when=FIRST_COMPLETED
+            )
+            broken = False
+            for future in done:
+                job, start = inflight.pop(future)
+                try:
+                    run = future.result()
+                except Exception as exc:
+                    broken |= isinstance(exc, BrokenProcessPool)
+                    run = CampaignRun(
+                        job.campaign_id, "error", time.perf_counter() - start,
+                        f"{type(exc).__name__}: {exc}",
+                    )
+                print(f"Job {job.id}: {run.status} in {run.seconds:.1f}s")
+                unrecorded.append((job, run))
+                runs.append(run)
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+            if inflight and time.monotonic() - last_beat >= WORKER_HEARTBEAT_SECONDS:
+                last_beat = time.monotonic()
+                try:
+                    queue.heartbeat([job for job, _ in inflight.values()])
+                except Exception as exc:
+                    print(f"  Queue unavailable ({type(exc).__name__}: {exc}); heartbeat skipped")
+    finally:
+        pool.shutdown()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    if unrecorded:
+        print(f"  {len(unrecorded)} job outcome(s) not recorded; the queue will hand "
+              "those jobs out again")
+    return runs
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="ONA perceptual network analysis for ClimaLab campaigns."
+    )
+    parser.add_argument(
+        "campaign_id", nargs="?",
+        help="campaign to analyse (default: all closed/archived campaigns)",
+    )
+    parser.add_argument(
+        "--pushdown", action="store_true",
+        help="aggregate dimension means in the database (ona_respondent_vectors RPC)",
+    )
+    parser.add_argument(
+        "--verify-pushdown", action="store_true",
+        help="compare pushdown and client-side vectors instead of running the analysis",
+    )
+    parser.add_argument(
+        "--graph-mode", choices=["auto", "dense", "knn"], default=GRAPH_MODE,
+        help=f"similarity graph construction (auto: knn from {SPARSE_GRAPH_MIN_NODES} respondents)",
+    )
+    parser.add_argument(
+        "--kernel", choices=["cosine", "pearson", "rbf"], default=SIM_KERNEL,
+        help="respondent similarity kernel",
+    )
+    parser.add_argument(
+        "--float32", action="store_true",
+        help="compute similarities in float32 (half the memory, faster GEMM)",
+    )
+    parser.add_argument(
+        "--stability-iterations", type=int, default=STABILITY_ITERATIONS,
+        help="maximum Leiden runs in the stability ensemble",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=STABILITY_SEED,
+        help="master seed for the Leiden ensemble (reruns are identical)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=STABILITY_WORKERS,
+        help="processes for the Leiden ensemble",
+    )
+    parser.add_argument(
+        "--centrality", choices=["auto", "exact", "approx"], default=CENTRALITY_MODE,
+        help=f"betweenness computation (auto: sampled sources from {APPROX_BETWEENNESS_MIN_NODES} nodes)",
+    )
+    parser.add_argument(
+        "--betweenness-samples", type=int, default=BETWEENNESS_SAMPLES,
+        help="sampled source vertices for approximate betweenness",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=BATCH_CONCURRENCY,
+        help="campaigns analysed in parallel worker processes",
+    )
+    parser.add_argument(
+        "--worker", action="store_true",
+        help="stay resident and analyse campaigns from the ona_jobs queue "
+             "(with --snapshot: an in-memory queue of the snapshot's campaigns)",
+    )
+    parser.add_argument(
+        "--drain", action="store_true",
+        help="with --worker, exit once the queue is empty",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="recompute even when the input fingerprint matches the stored result",
+    )
+    parser.add_argument(
+        "--instrument-cache", metavar="DIR",
+        help="keep dimension/item metadata per instrument in DIR between runs",
+    )
+    parser.add_argument(
+        "--snapshot", metavar="DIR",
+        help="read campaigns from a local snapshot and write results there as JSON",
+    )
+    parser.add_argument(
+        "--export-snapshot", metavar="DIR",
+        help="copy campaign vectors from Supabase into a snapshot and exit",
+    )
+    parser.add_argument(
+        "--export-people", action="store_true",
+        help="with --export-snapshot, also store each respondent's person key "
+             "(needed for --longitudinal on the snapshot)",
+    )
+    parser.add_argument(
+        "--longitudinal", action="store_true",
+        help="warm-start Leiden from the organisation's previous campaign and "
+             "store a community transition table",
+    )
+    parser.add_argument(
+        "--resolutions", metavar="LIST",
+        help="comma-separated resolution grid for a multi-resolution sweep (e.g. 0.5,1,2)",
+    )
+    parser.add_argument(
+        "--resolution-objective", choices=["modularity", "cpm"], default=SWEEP_OBJECTIVE,
+        help="sweep objective; cpm resolutions are multiples of the weighted density",
+    )
+    parser.add_argument(
+        "--null-models", type=int, default=0, metavar="N",
+        help="test the modularity against N null graphs (p-value and z in stability)",
+    )
+    parser.add_argument(
+        "--null-model", choices=["permute", "rewire"], default=NULL_MODEL,
+        help="permute: dimensions shuffled across respondents; "
+             "rewire: degree-preserving edge swaps of the graph",
+    )
+    parser.add_argument(
+        "--bootstrap", type=int, default=0, metavar="B",
+        help="resample respondents B times for confidence intervals on community "
+             "scores, discriminant spreads and modularity (e.g. 500)",
+    )
+    parser.add_argument(
+        "--log-json", action="store_true",
+        help="log each stage's timings as one JSON line on stderr",
+    )
+    parser.add_argument(
+        "--profile", choices=STAGES, metavar="STAGE",
+        help=f"cProfile + tracemalloc one stage ({', '.join(STAGES)})",
+    )
+    parser.add_argument(
+        "--profile-dir", default=".", metavar="DIR",
+        help="where --profile writes <campaign>-<stage>.prof and .alloc.txt",
+    )
+    args = parser.parse_args(argv)
+    if args.snapshot and (args.verify_pushdown or args.export_snapshot):
+        parser.error("--snapshot reads offline; it can't be combined with "
+                     "--verify-pushdown or --export-snapshot")
+    if args.worker and (args.campaign_id or args.verify_pushdown or args.export_snapshot):
+        parser.error("--worker takes campaigns from the queue; it can't be combined "
+                     "with a campaign id, --verify-pushdown or --export-snapshot")
+    if args.drain and not args.worker:
+        parser.error("--drain only applies to --worker")
+    if args.longitudinal and args.concurrency > 1:
+        parser.error("--longitudinal warm-starts each campaign from the previous one, "
+                     "so campaigns must run one at a time (--concurrency 1)")
+    if args.export_people and not args.export_snapshot:
+        parser.error("--export-people only applies to --export-snapshot")
+    needs_key = args.export_people or (args.longitudinal and not args.snapshot)
+    if needs_key and not PERSON_KEY_SECRET:
+        parser.error("--longitudinal and --export-people match participants through "
+                     "ONA_PERSON_KEY_SECRET; set it in the environment")
+    return args
 
 
 def main() -> None:
-    sb = get_supabase()
+    args = parse_args()
+    opts = ONAOptions(
+        pushdown=args.pushdown,
+        graph_mode=args.graph_mode,
+        kernel=args.kernel,
+        dtype="float32" if args.float32 else "float64",
+        stability_iterations=args.stability_iterations,
+        seed=args.seed,
+        workers=args.workers,
+        centrality=args.centrality,
+        betweenness_samples=args.betweenness_samples,
+        force=args.force,
+        instrument_cache=args.instrument_cache,
+        snapshot=args.snapshot,
+        longitudinal=args.longitudinal,
+        resolutions=tuple(float(r) for r in (args.resolutions or "").split(",") if r.strip()),
+        resolution_objective=args.resolution_objective,
+        bootstrap=args.bootstrap,
+        null_models=args.null_models,
+        null_model=args.null_model,
+        log_json=args.log_json,
+        profile_stage=args.profile,
+        profile_dir=args.profile_dir,
+    )
+    source = open_source(opts)
 
-    if len(sys.argv) > 1:
-        process_campaign(sb, sys.argv[1])
-    else:
-        camps = (
-            sb.table("campaigns")
-            .select("id")
-            .in_("status", ["closed", "archived"])
-            .order("created_at")
-            .execute()
+    if args.worker:
+        # Offline there is nobody to enqueue, so the snapshot is the queue
+        if opts.snapshot:
+            queue: JobQueue = MemoryQueue(source.campaign_ids())
+        else:
+            queue = SupabaseQueue(source.sb)
+        runs = run_worker(
+            queue, opts, concurrency=args.concurrency,
+            drain=args.drain or bool(opts.snapshot),
         )
-        if not camps.data:
+        if runs:
+            print_batch_summary(runs)
+        return
+
+    if args.campaign_id:
+        campaign_ids = [args.campaign_id]
+    else:
+        campaign_ids = source.campaign_ids()
+        if not campaign_ids:
             print("No closed campaigns found")
             return
-        print(f"Found {len(camps.data)} campaigns to process")
-        for c in camps.data:
-            process_campaign(sb, c["id"])
+        print(f"Found {len(campaign_ids)} campaigns to process")
+
+    if args.verify_pushdown:
+        mismatches = 0
+        for cid in campaign_ids:
+            print(f"\n=== Pushdown check: {cid} ===")
+            mismatches += not verify_pushdown(source.sb, cid)
+        sys.exit(1 if mismatches else 0)
+
+    if args.export_snapshot:
+        snapshot = SnapshotSource(args.export_snapshot)
+        exported = sum(
+            export_snapshot(source, snapshot, cid, opts, people=args.export_people)
+            for cid in campaign_ids
+        )
+        print(f"\nExported {exported}/{len(campaign_ids)} campaigns to {args.export_snapshot}")
+        return
+
+    runs = run_batch(source, campaign_ids, opts, concurrency=args.concurrency)
+    print_batch_summary(runs)
 
     print("\nONA analysis complete!")
+    if any(r.status == "error" for r in runs):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
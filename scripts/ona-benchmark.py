@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "python-igraph>=1.0.0",
+#     "supabase>=2.0.0",
+#     "numpy>=1.24",
+#     "pandas>=2.0",
+#     "scipy>=1.10",
+#     "matplotlib>=3.7",
+# ]
+# ///
+"""
+ONA benchmark — scaling of scripts/ona-analysis.py on synthetic campaigns.
+
+Generates respondent × dimension matrices with planted communities (and
+department/tenure/gender metadata correlated with them), runs the pipeline
+stages on each size in a fresh process, and writes a JSON report with
+wall/CPU time and peak RSS per stage (analysis process and Leiden pool)
+plus how well Leiden recovered the planted communities. Runs fully offline: no Supabase connection is made.
+
+Usage:
+    uv run scripts/ona-benchmark.py                          # default sizes
+    uv run scripts/ona-benchmark.py --sizes 1000,10000,50000 --dims 21
+    uv run scripts/ona-benchmark.py --baseline old.json      # exit 1 on regressions
+"""
+
+import os
+import sys
+import argparse
+import contextlib
+import importlib.util
+import json
+import platform
+import subprocess
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+PIPELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ona-analysis.py")
+
+DEFAULT_SIZES = "100,500,1000,5000"
+DEFAULT_DIMS = 21  # Core instrument dimensions minus ENG
+DEFAULT_COMMUNITIES = 4
+ITEMS_PER_DIM = 4  # Likert items averaged into each dimension score
+SEPARATION = 0.5  # ± offset of each community centroid from the scale midpoint
+ITEM_NOISE = 1.0  # sd of a respondent's item score around the centroid
+DEPT_AFFINITY = 0.6  # share of a community working in "its" department
+RECOVERY_MIN_NMI = 0.8  # planted vs detected partition NMI needed to pass
+REGRESSION_TOLERANCE = 0.25  # slowdown vs baseline flagged as a regression
+DEPARTMENTS = ["Ventas", "Operaciones", "TI", "RRHH", "Finanzas", "Marketing"]
+TENURES = ["<1", "1-3", "3-5", "5-10", "10+", ""]
+GENDERS = ["Femenino", "Masculino", "No binario", ""]
+
+
+def load_pipeline():
+    """Import scripts/ona-analysis.py (not importable by name: it has a hyphen)."""
+    spec = importlib.util.spec_from_file_location("ona_analysis", PIPELINE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ona_analysis"] = module  # Leiden workers unpickle by module name
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------
+# 1. Synthetic campaigns
+# ---------------------------------------------------------------------------
+def synthetic_campaign(
+    n: int,
+    n_dims: int = DEFAULT_DIMS,
+    n_communities: int = DEFAULT_COMMUNITIES,
+    seed: int = 0,
+    separation: float = SEPARATION,
+    noise: float = ITEM_NOISE,
+) -> tuple[pd.DataFrame, list[str], np.ndarray]:
+    """Return (vectors DataFrame, dim_codes, planted community per row).
+
+    The DataFrame has the shape fetch_campaign_data returns. Each community
+    gets a centroid of ±separation around 3 per dimension; item scores are
+    drawn around it, rounded and clipped to 1-5, then averaged per
+    dimension like real responses.
+    """
+    rng = np.random.default_rng(seed)
+    dim_codes = [f"D{j:02d}" for j in range(n_dims)]
+    planted = rng.integers(n_communities, size=n)
+    centroids = 3 + separation * rng.choice([-1.0, 1.0], size=(n_communities, n_dims))
+    items = centroids[planted][:, :, None] + rng.normal(0, noise, size=(n, n_dims, ITEMS_PER_DIM))
+    scores = np.clip(np.rint(items), 1, 5).mean(axis=2)
+
+    df = pd.DataFrame(scores, columns=dim_codes)
+    df["_id"] = [f"{i:08x}-{seed:04x}-0000-0000-000000000000" for i in range(n)]
+    home = rng.permutation(len(DEPARTMENTS))[planted % len(DEPARTMENTS)]
+    stays = rng.random(n) < DEPT_AFFINITY
+    dept = np.where(stays, home, rng.integers(len(DEPARTMENTS), size=n))
+    df["_dept"] = [DEPARTMENTS[k] for k in dept]
+    df["_tenure"] = [TENURES[k] for k in rng.integers(len(TENURES), size=n)]
+    df["_gender"] = [GENDERS[k] for k in rng.integers(len(GENDERS), size=n)]
+    return df, dim_codes, planted
+
+
+# ---------------------------------------------------------------------------
+# 2. One benchmark run (executed in a child process)
+# ---------------------------------------------------------------------------
+@dataclass
+class BenchRun:
+    n: int
+    dims: int
+    communities: int
+    seed: int
+    stages: dict[str, dict] = field(default_factory=dict)  # StageTimings records
+    graph: dict = field(default_factory=dict)
+    detected_communities: int = 0
+    modularity: float = 0.0
+    stability_nmi: float = 0.0
+    recovery_nmi: float = 0.0
+    recovered: bool = False
+    image_kb: int = 0
+    error: str = ""
+
+
+def run_one(args: argparse.Namespace, n: int) -> BenchRun:
+    """Generate one campaign of n respondents and time each pipeline stage."""
+    ona = load_pipeline()
+    seed = args.seed
+    run = BenchRun(n, args.dims, args.communities, seed)
+    timings = ona.StageTimings(f"{n:08d}", profile=args.profile, profile_dir=args.profile_dir)
+    run.stages = timings.stages
+
+    with timings.stage("generate"):
+        df, dim_codes, planted = synthetic_campaign(
+            n, args.dims, args.communities, seed, args.separation, args.noise
+        )
+    with timings.stage("graph"):
+        g = ona.build_similarity_graph(df, dim_codes)
+    run.graph = {
+        "mode": g["mode"],
+        "edges": g.ecount(),
+        "density": round(g.density(), 4),
+    }
+    if g.ecount() == 0:
+        run.error = "no edges"
+        return run
+
+    with timings.stage("communities"):
+        partition, stability = ona.detect_communities_with_stability(
+            g, n_iterations=args.stability_iterations, seed=seed, workers=args.workers
+        )
+    with timings.stage("centrality"):
+        centrality = ona.CentralityCache(g, seed=seed)
+        centrality.betweenness()
+        centrality.edge_betweenness()
+        centrality.eigenvector()
+    with timings.stage("metrics"):
+        ona.compute_ona_metrics(g, partition, stability, df, dim_codes, centrality)
+    with timings.stage("layout"):
+        coords, _ = ona.compute_layout(g, seed=seed)
+    with timings.stage("image"):
+        image = ona.generate_graph_image(g, partition.membership, centrality, coords, seed=seed)
+
+    run.detected_communities = len(partition)
+    run.modularity = round(partition.modularity, 4)
+    run.stability_nmi = stability["nmi"]
+    run.recovery_nmi = round(
+        ona.ig.compare_communities(planted.tolist(), partition.membership, method="nmi"), 4
+    )
+    run.recovered = run.recovery_nmi >= RECOVERY_MIN_NMI
+    run.image_kb = len(image) * 3 // 4 // 1024
+    return run
+
+
+def run_isolated(args: argparse.Namespace, n: int) -> BenchRun:
+    """run_one in a fresh interpreter: per-size peak RSS, and a crash or OOM
+    at one size doesn't end the suite."""
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--run-one", str(n),
+        "--dims", str(args.dims), "--communities", str(args.communities),
+        "--seed", str(args.seed), "--separation", str(args.separation),
+        "--noise", str(args.noise), "--stability-iterations", str(args.stability_iterations),
+        "--workers", str(args.workers), "--profile-dir", args.profile_dir,
+    ] + (["--profile", args.profile] if args.profile else [])
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=None, text=True)
+    if proc.returncode != 0 or not proc.stdout.strip():
+        return BenchRun(n, args.dims, args.communities, args.seed,
+                        error=f"exit code {proc.returncode}")
+    return BenchRun(**json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+# ---------------------------------------------------------------------------
+# 3. Report
+# ---------------------------------------------------------------------------
+def machine_info() -> dict:
+    import igraph
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "igraph": igraph.__version__,
+    }
+
+
+def print_report(runs: list[BenchRun]) -> None:
+    names = ["graph", "communities", "centrality", "metrics", "layout", "image"]
+    print(f"\n{'n':>7}  " + "  ".join(f"{s:>12}" for s in names)
+          + f"  {'peak MB':>8}  {'pool MB':>8}  {'recovery':>8}")
+    for r in runs:
+        if r.error:
+            print(f"{r.n:>7}  ERROR: {r.error}")
+            continue
+        peaks = [s["peak_rss_mb"] for s in r.stages.values() if "peak_rss_mb" in s]
+        pool = [s["children_peak_rss_mb"] for s in r.stages.values()
+                if "children_peak_rss_mb" in s]
+        print(
+            f"{r.n:>7}  "
+            + "  ".join(f"{r.stages[s]['seconds']:>11.2f}s" for s in names)
+            + f"  {max(peaks, default=0):>8.0f}"
+            + f"  {max(pool, default=0):>8.0f}"
+            + f"  {r.recovery_nmi:>7.3f}{'' if r.recovered else '!'}"
+        )
+
+
+def find_regressions(runs: list[BenchRun], baseline: dict, tolerance: float) -> list[str]:
+    """Stages slower than baseline by more than `tolerance` (same n and dims)."""
+    previous = {(r["n"], r["dims"]): r for r in baseline.get("runs", [])}
+    found = []
+    for r in runs:
+        old = previous.get((r.n, r.dims))
+        if old is None or r.error:
+            continue
+        for name, stage in r.stages.items():
+            before = old["stages"].get(name, {}).get("seconds")
+            # sub-10ms stages are mostly timer noise
+            now = stage["seconds"]
+            if before and before >= 0.01 and now > before * (1 + tolerance):
+                found.append(f"n={r.n} {name}: {before:.3f}s -> {now:.3f}s")
+    return found
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the ONA pipeline on synthetic data.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated respondent counts (100 to 50000)")
+    parser.add_argument("--dims", type=int, default=DEFAULT_DIMS, help="dimensions per respondent")
+    parser.add_argument("--communities", type=int, default=DEFAULT_COMMUNITIES,
+                        help="planted communities")
+    parser.add_argument("--seed", type=int, default=0, help="generator and pipeline seed")
+    parser.add_argument("--separation", type=float, default=SEPARATION,
+                        help="centroid offset from 3 per dimension (lower = harder to recover)")
+    parser.add_argument("--noise", type=float, default=ITEM_NOISE,
+                        help="sd of item scores around the community centroid")
+    parser.add_argument("--stability-iterations", type=int, default=10,
+                        help="Leiden runs per size (the pipeline default is 50)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the Leiden ensemble")
+    parser.add_argument("--output", default="ona-benchmark.json", help="JSON report path")
+    parser.add_argument("--baseline", help="earlier report to compare stage times against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--profile", metavar="STAGE",
+                        help="cProfile + tracemalloc one stage (graph, communities, ...)")
+    parser.add_argument("--profile-dir", default=".", help="where --profile writes its files")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+
+    if args.run_one is not None:
+        # Child process: pipeline progress goes to stderr, the result to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            run = run_one(args, args.run_one)
+        print(json.dumps(asdict(run)))
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    runs = []
+    for n in sizes:
+        print(f"=== n={n}, dims={args.dims}, communities={args.communities} ===", flush=True)
+        runs.append(run_isolated(args, n))
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "machine": machine_info(),
+        "params": {
+            "stability_iterations": args.stability_iterations,
+            "workers": args.workers,
+            "items_per_dim": ITEMS_PER_DIM,
+            "separation": args.separation,
+            "item_noise": args.noise,
+            "recovery_min_nmi": RECOVERY_MIN_NMI,
+        },
+        "runs": [asdict(r) for r in runs],
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(runs)
+    print(f"\nReport written to {args.output}")
+
+    failed = [r for r in runs if r.error or not r.recovered]
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(runs, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"  REGRESSION {line}")
+        failed += regressions
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -362,7 +362,11 @@ export async function generateNarrative(
       .select("result_type, segment_type, dimension_code, avg_score, favorability_pct, metadata")
       .eq("campaign_id", campaignId)
       .eq("segment_type", "global"),
-    supabase.from("campaign_analytics").select("analysis_type, data").eq("campaign_id", campaignId),
+    supabase
+      .from("campaign_analytics")
+      .select("analysis_type, data")
+      .eq("campaign_id", campaignId)
+      .neq("analysis_type", "ona_network_detail"),
   ]);
 
   const results = resultsRes.data ?? [];
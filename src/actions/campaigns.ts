@@ -1001,17 +1001,26 @@ export async function calculateResults(campaignId: string): Promise<ActionResult
     await supabase.from("campaign_analytics").insert(batch);
   }
 
-  // Non-blocking ONA analysis (Python-dependent, fails gracefully)
-  try {
-    const { exec } = await import("child_process");
-    const script = `${process.cwd()}/scripts/ona-analysis.py`;
-    // Try uv first (auto-resolves deps), fallback to python3
-    const cmd = `uv run ${script} ${campaignId} 2>/dev/null || python3 ${script} ${campaignId}`;
-    exec(cmd, { env: process.env }, (error: Error | null) => {
-      if (error) console.warn("ONA deferred:", error.message);
+  // ONA analysis: queued for the resident worker (scripts/ona-analysis.py
+  // --worker) when one runs, otherwise a non-blocking one-shot run
+  // (Python-dependent, fails gracefully)
+  if (process.env.ONA_WORKER === "true") {
+    const { error: queueError } = await supabase.rpc("enqueue_ona_job", {
+      p_campaign_id: campaignId,
     });
-  } catch {
-    /* Python not available */
+    if (queueError) console.warn("ONA not queued:", queueError.message);
+  } else {
+    try {
+      const { exec } = await import("child_process");
+      const script = `${process.cwd()}/scripts/ona-analysis.py`;
+      // Try uv first (auto-resolves deps), fallback to python3
+      const cmd = `uv run ${script} ${campaignId} 2>/dev/null || python3 ${script} ${campaignId}`;
+      exec(cmd, { env: process.env }, (error: Error | null) => {
+        if (error) console.warn("ONA deferred:", error.message);
+      });
+    } catch {
+      /* Python not available */
+    }
   }
 
   revalidatePath(`/campaigns/${campaignId}`);
@@ -14,8 +14,16 @@ export interface ONAGraphSummary {
   communities: number;
   modularity: number;
   avg_clustering: number;
+  // Graph construction ("knn" for large campaigns; absent in older data)
+  graph_mode?: "dense" | "knn";
+  knn_k?: number;
+  kernel?: "cosine" | "pearson" | "rbf";
 }
 
+// [low, high] percentile interval; null bounds when a community was never
+// drawn in enough replicates
+export type ONAInterval = [number | null, number | null];
+
 export interface ONACommunity {
   id: number;
   size: number;
@@ -25,6 +33,7 @@ export interface ONACommunity {
   department_distribution: Record<string, { count: number; pct: number }>;
   dimension_scores: Record<string, number>;
   top_differences: Array<{ code: string; diff: number; cluster_score: number }>;
+  dimension_ci?: Record<string, ONAInterval>; // only with --bootstrap
 }
 
 export interface ONADiscriminant {
@@ -34,6 +43,7 @@ export interface ONADiscriminant {
   max_value: number;
   min_cluster: number;
   min_value: number;
+  spread_ci?: ONAInterval; // only with --bootstrap
 }
 
 export interface ONADeptDensity {
@@ -54,6 +64,129 @@ export interface ONAStability {
   label: "robust" | "moderate" | "weak";
   iterations: number;
   method: string;
+  seed?: number;
+  converged?: boolean;
+  warm_start?: boolean;
+  nmi_min?: number;
+  consensus?: ONAConsensus;
+  significance?: ONASignificance;
+}
+
+// Observed modularity vs Leiden on null graphs (--null-models)
+export interface ONASignificance {
+  method: "permute" | "rewire";
+  samples: number;
+  observed: number; // best of 3 Leiden runs, like each null graph
+  null_mean: number;
+  null_std: number;
+  z: number | null;
+  p_value: number;
+  significant: boolean; // p_value <= 0.05
+}
+
+// Consensus partition of the Leiden ensemble (co-association matrix).
+// Per-respondent membership/confidence live in ONANodeTable.
+export interface ONAConsensus {
+  communities: number;
+  agreement_nmi: number;
+  mean_confidence: number;
+  low_confidence: number;
+}
+
+// How betweenness was computed: exact, or estimated from sampled sources
+// (error_bound: max absolute error of betweenness / (n(n-2)/2), 95%).
+export interface ONACentrality {
+  mode: "exact" | "approx";
+  samples: number | null;
+  error_bound: number;
+}
+
+// Per-node columns, all aligned with id (first 8 chars of respondent_id).
+// department holds indexes into departments.
+export interface ONANodeTable {
+  id: string[];
+  departments: string[];
+  department: number[];
+  community: number[];
+  eigenvector: number[];
+  betweenness: number[];
+  degree: number[];
+  connections: number[];
+  consensus?: number[];
+  confidence?: number[];
+  sweep?: number[][]; // one membership per resolution_sweep level
+  x: number[];
+  y: number[];
+}
+
+// Stored apart from ONAResults (analysis_type = 'ona_network_detail')
+export interface ONADetail {
+  graph_image: string; // base64 PNG
+  layout: "fruchterman_reingold" | "fruchterman_reingold_grid" | "stored";
+  nodes: ONANodeTable;
+}
+
+// Longitudinal mode: communities matched against the organisation's previous
+// campaign through returning respondents (linked by participant email)
+export interface ONACommunityTransition {
+  community: number;
+  size: number;
+  returning: number;
+  from: number | null; // previous community holding most returning members
+  from_share: number;
+  jaccard: number;
+}
+
+export interface ONALongitudinal {
+  previous_campaign_id: string;
+  returning: number;
+  coverage: number;
+  transitions: ONACommunityTransition[];
+  overlap: number[][]; // rows: previous communities, columns: current
+}
+
+// Leiden at several resolutions on the same graph, ordered coarse to fine.
+// parents maps each community to the community of the previous level that
+// holds most of its members (null on the first level).
+export interface ONAResolutionLevel {
+  resolution: number;
+  communities: number;
+  sizes: number[];
+  quality: number; // objective at this resolution
+  modularity: number; // standard modularity (resolution 1)
+  stability: number; // mean pairwise NMI across runs
+  parents: number[] | null;
+}
+
+export interface ONAResolutionSweep {
+  objective: "modularity" | "cpm";
+  runs: number;
+  levels: ONAResolutionLevel[];
+}
+
+// Respondent bootstrap over the fixed partition and similarity graph
+export interface ONABootstrap {
+  replicates: number;
+  confidence: number;
+  modularity_ci: ONAInterval;
+}
+
+// Per-stage instrumentation of the run that produced the result
+export interface ONAStageTiming {
+  seconds: number;
+  cpu_seconds: number;
+  peak_rss_mb?: number; // Linux only; the analysis process, not its pool
+  children_peak_rss_mb?: number; // largest reaped pool process so far
+  alloc_peak_mb?: number; // profiled stage only
+  n?: number;
+  edges?: number;
+  communities?: number;
+  runs?: number;
+}
+
+export interface ONATimings {
+  total_seconds: number;
+  stages: Record<string, ONAStageTiming>;
 }
 
 export interface ONACriticalEdge {
@@ -77,6 +210,17 @@ export interface ONAResults {
   // New fields (optional for backwards compat with old data)
   stability?: ONAStability;
   critical_edges?: ONACriticalEdge[];
+  centrality?: ONACentrality;
+  tenure_density?: ONADeptDensity;
+  gender_density?: ONADeptDensity;
+  // sha256 of inputs + parameters; the script skips reruns when it matches
+  input_fingerprint?: string;
+  longitudinal?: ONALongitudinal;
+  resolution_sweep?: ONAResolutionSweep;
+  bootstrap?: ONABootstrap;
+  timings?: ONATimings;
+  // Only in results saved before the detail row existed; newer runs keep the
+  // image in ONADetail (see getONAGraphImage)
   graph_image?: string; // base64 PNG
 }
 
@@ -95,3 +239,35 @@ export async function getONAResults(campaignId: string): Promise<ActionResult<ON
   if (error) return { success: false, error: error.message };
   return { success: true, data: data.data as unknown as ONAResults };
 }
+
+// ---------------------------------------------------------------------------
+// getONAGraphImage — graph image from the detail row (fetched on demand)
+// ---------------------------------------------------------------------------
+export async function getONAGraphImage(campaignId: string): Promise<ActionResult<string | null>> {
+  const supabase = await createClient();
+  const { data, error } = await supabase
+    .from("campaign_analytics")
+    .select("graph_image:data->>graph_image")
+    .eq("campaign_id", campaignId)
+    .eq("analysis_type", "ona_network_detail")
+    .maybeSingle();
+
+  if (error) return { success: false, error: error.message };
+  return { success: true, data: (data?.graph_image as string | null) ?? null };
+}
+
+// ---------------------------------------------------------------------------
+// getONADetail — graph image, layout and per-node table
+// ---------------------------------------------------------------------------
+export async function getONADetail(campaignId: string): Promise<ActionResult<ONADetail | null>> {
+  const supabase = await createClient();
+  const { data, error } = await supabase
+    .from("campaign_analytics")
+    .select("data")
+    .eq("campaign_id", campaignId)
+    .eq("analysis_type", "ona_network_detail")
+    .maybeSingle();
+
+  if (error) return { success: false, error: error.message };
+  return { success: true, data: (data?.data as unknown as ONADetail | null) ?? null };
+}
@@ -129,7 +129,13 @@ function densityColor(value: number | null): string {
 // ---------------------------------------------------------------------------
 // Main component
 // ---------------------------------------------------------------------------
-export function NetworkClient({ data }: { data: ONAResults | null }) {
+export function NetworkClient({
+  data,
+  graphImage,
+}: {
+  data: ONAResults | null;
+  graphImage?: string | null;
+}) {
   const narrative = useMemo(
     () => (data ? (data.narrative ?? generateNarrative(data)) : ""),
     [data]
@@ -364,7 +370,7 @@ export function NetworkClient({ data }: { data: ONAResults | null }) {
       </Card>
 
       {/* Graph visualization */}
-      {data.graph_image && (
+      {graphImage && (
         <Card>
           <CardHeader>
             <CardTitle>Visualización del grafo</CardTitle>
@@ -377,7 +383,7 @@ export function NetworkClient({ data }: { data: ONAResults | null }) {
           <CardContent className="flex justify-center">
             {/* eslint-disable-next-line @next/next/no-img-element */}
             <img
-              src={`data:image/png;base64,${data.graph_image}`}
+              src={`data:image/png;base64,${graphImage}`}
               alt="Grafo de similitud perceptual"
               className="max-w-full h-auto rounded-lg border"
               style={{ maxHeight: 600 }}
@@ -1,15 +1,20 @@
 import { notFound } from "next/navigation";
 import { getCampaign } from "@/actions/campaigns";
-import { getONAResults } from "@/actions/ona";
+import { getONAGraphImage, getONAResults } from "@/actions/ona";
 import { NetworkClient } from "./network-client";
 
 export default async function NetworkPage({ params }: { params: Promise<{ id: string }> }) {
   const { id } = await params;
-  const [campaignResult, onaResult] = await Promise.all([getCampaign(id), getONAResults(id)]);
+  const [campaignResult, onaResult, imageResult] = await Promise.all([
+    getCampaign(id),
+    getONAResults(id),
+    getONAGraphImage(id),
+  ]);
 
   if (!campaignResult.success) notFound();
 
   const onaData = onaResult.success ? onaResult.data : null;
+  const graphImage = (imageResult.success ? imageResult.data : null) ?? onaData?.graph_image;
 
-  return <NetworkClient data={onaData} />;
+  return <NetworkClient data={onaData} graphImage={graphImage} />;
 }
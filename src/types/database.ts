@@ -683,6 +683,7 @@ export type Database = {
       [_ in never]: never
     }
     Functions: {
+      enqueue_ona_job: { Args: { p_campaign_id: string }; Returns: string }
       generate_slug: { Args: { input: string }; Returns: string }
       get_department_headcount: {
         Args: { p_dept_name: string; p_org_id: string }
@@ -0,0 +1,55 @@
+-- Migration: 000020_ona_respondent_vectors
+-- Server-side aggregation for scripts/ona-analysis.py (--pushdown mode).
+-- Returns one row per completed respondent with the mean score of each
+-- requested dimension code, mirroring the script's client-side path:
+-- attention checks excluded, reverse items scored as 6 - score, NULL where
+-- the respondent answered no item of that dimension.
+
+CREATE OR REPLACE FUNCTION ona_respondent_vectors(p_campaign_id uuid, p_codes text[])
+RETURNS TABLE (
+  respondent_id uuid,
+  department text,
+  tenure text,
+  gender text,
+  means float8[]
+) AS $$
+  WITH camp AS (
+    SELECT instrument_id || COALESCE(module_instrument_ids, '{}') AS instrument_ids
+    FROM campaigns
+    WHERE id = p_campaign_id
+  ),
+  completed AS (
+    SELECT id, department, tenure, gender
+    FROM respondents
+    WHERE campaign_id = p_campaign_id AND status = 'completed'
+  ),
+  dim_means AS (
+    -- float8 division of exact integer sums matches numpy's mean bit for bit
+    SELECT
+      c.id AS respondent_id,
+      d.code,
+      sum(CASE WHEN i.is_reverse THEN 6 - r.score ELSE r.score END)::float8
+        / count(*) AS mean
+    FROM completed c
+    JOIN responses r ON r.respondent_id = c.id
+    JOIN items i ON i.id = r.item_id AND NOT i.is_attention_check
+    JOIN dimensions d ON d.id = i.dimension_id
+    JOIN camp ON d.instrument_id = ANY (camp.instrument_ids)
+    WHERE r.score IS NOT NULL AND d.code = ANY (p_codes)
+    GROUP BY c.id, d.code
+  )
+  SELECT
+    c.id,
+    c.department,
+    c.tenure,
+    c.gender,
+    array_agg(m.mean ORDER BY k.ord)
+  FROM completed c
+  CROSS JOIN unnest(p_codes) WITH ORDINALITY AS k(code, ord)
+  LEFT JOIN dim_means m ON m.respondent_id = c.id AND m.code = k.code
+  GROUP BY c.id, c.department, c.tenure, c.gender;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Raw per-respondent scores: only the service role (used by the script) may call it
+REVOKE EXECUTE ON FUNCTION ona_respondent_vectors(uuid, text[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ona_respondent_vectors(uuid, text[]) TO service_role;
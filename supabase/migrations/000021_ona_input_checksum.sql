@@ -0,0 +1,52 @@
+-- Migration: 000021_ona_input_checksum
+-- Change detection for scripts/ona-analysis.py: a single md5 over everything
+-- the ONA vectors depend on — the campaign's dimension codes and item flags,
+-- its completed respondents with their demographics, and their responses.
+-- The script combines it with its own parameters into input_fingerprint and
+-- skips campaigns whose fingerprint matches the stored result.
+
+CREATE OR REPLACE FUNCTION ona_input_checksum(p_campaign_id uuid)
+RETURNS text AS $$
+  WITH camp AS (
+    SELECT instrument_id || COALESCE(module_instrument_ids, '{}') AS instrument_ids
+    FROM campaigns
+    WHERE id = p_campaign_id
+  ),
+  config AS (
+    SELECT string_agg(
+      format('%s:%s:%s:%s:%s', d.id, d.code, i.id, i.is_reverse, i.is_attention_check),
+      ',' ORDER BY d.id, i.id
+    ) AS s
+    FROM camp
+    JOIN dimensions d ON d.instrument_id = ANY (camp.instrument_ids)
+    LEFT JOIN items i ON i.dimension_id = d.id
+  ),
+  completed AS (
+    SELECT id, department, tenure, gender
+    FROM respondents
+    WHERE campaign_id = p_campaign_id AND status = 'completed'
+  ),
+  -- one digest per respondent keeps the aggregated string small
+  answers AS (
+    SELECT
+      c.id,
+      md5(string_agg(format('%s:%s', r.item_id, r.score), ',' ORDER BY r.item_id, r.id)) AS s
+    FROM completed c
+    JOIN responses r ON r.respondent_id = c.id
+    GROUP BY c.id
+  ),
+  people AS (
+    SELECT string_agg(
+      format('%s:%s:%s:%s:%s', c.id, c.department, c.tenure, c.gender, a.s),
+      ',' ORDER BY c.id
+    ) AS s
+    FROM completed c
+    LEFT JOIN answers a ON a.id = c.id
+  )
+  SELECT md5(format('%s|%s', config.s, people.s))
+  FROM camp, config, people;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Same audience as ona_respondent_vectors: only the service role
+REVOKE EXECUTE ON FUNCTION ona_input_checksum(uuid) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ona_input_checksum(uuid) TO service_role;
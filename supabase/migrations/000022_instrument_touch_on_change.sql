@@ -0,0 +1,37 @@
+-- Migration: 000022_instrument_touch_on_change
+-- Any insert, update or delete of an instrument's dimensions or items bumps
+-- instruments.updated_at, so it works as a version stamp for the whole
+-- instrument. scripts/ona-analysis.py caches dimension/item metadata per
+-- instrument and refetches it only when this stamp changes. SECURITY DEFINER:
+-- editors of items may not have UPDATE rights on instruments under RLS.
+
+CREATE OR REPLACE FUNCTION touch_instrument_from_dimension()
+RETURNS trigger AS $$
+BEGIN
+  UPDATE instruments SET updated_at = now()
+  WHERE id IN (OLD.instrument_id, NEW.instrument_id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION touch_instrument_from_item()
+RETURNS trigger AS $$
+BEGIN
+  UPDATE instruments SET updated_at = now()
+  WHERE id IN (
+    SELECT instrument_id FROM dimensions
+    WHERE id IN (OLD.dimension_id, NEW.dimension_id)
+  );
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER trg_dimensions_touch_instrument
+  AFTER INSERT OR UPDATE OR DELETE ON dimensions
+  FOR EACH ROW
+  EXECUTE FUNCTION touch_instrument_from_dimension();
+
+CREATE TRIGGER trg_items_touch_instrument
+  AFTER INSERT OR UPDATE OR DELETE ON items
+  FOR EACH ROW
+  EXECUTE FUNCTION touch_instrument_from_item();
@@ -0,0 +1,95 @@
+-- Migration: 000023_ona_jobs
+-- Job queue for the resident ONA worker (scripts/ona-analysis.py --worker).
+-- calculateResults enqueues the campaign once its analytics are rewritten
+-- (when ONA_WORKER is set); workers claim jobs with claim_ona_job and record
+-- the outcome and duration on the row.
+
+CREATE TABLE ona_jobs (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  campaign_id uuid NOT NULL REFERENCES campaigns(id) ON DELETE CASCADE,
+  status text NOT NULL DEFAULT 'queued'
+    CHECK (status IN ('queued', 'running', 'done', 'failed')),
+  result text, -- ok, unchanged, no_data, no_edges or error
+  error text,
+  attempts integer NOT NULL DEFAULT 0,
+  worker text, -- host:pid of the worker that claimed the job last
+  enqueued_at timestamptz NOT NULL DEFAULT now(),
+  started_at timestamptz,
+  finished_at timestamptz,
+  duration_seconds numeric(10,3)
+);
+
+CREATE INDEX idx_ona_jobs_campaign ON ona_jobs(campaign_id);
+CREATE INDEX idx_ona_jobs_pending ON ona_jobs(enqueued_at) WHERE status IN ('queued', 'running');
+
+-- RLS: admins see their campaigns' jobs; workers use the service role
+ALTER TABLE ona_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "admin can view ona jobs"
+  ON ona_jobs FOR SELECT TO authenticated
+  USING (
+    campaign_id IN (
+      SELECT id FROM campaigns
+      WHERE organization_id = get_user_org_id() OR get_user_role() = 'super_admin'
+    )
+  );
+
+-- Queue a campaign unless it is already waiting; returns the job id
+CREATE OR REPLACE FUNCTION enqueue_ona_job(p_campaign_id uuid)
+RETURNS uuid AS $$
+DECLARE
+  job_id uuid;
+BEGIN
+  IF auth.role() IS DISTINCT FROM 'service_role'
+     AND get_user_role() IS DISTINCT FROM 'super_admin'
+     AND NOT EXISTS (
+       SELECT 1 FROM campaigns
+       WHERE id = p_campaign_id AND organization_id = get_user_org_id()
+     ) THEN
+    RAISE EXCEPTION 'campaign % not found', p_campaign_id;
+  END IF;
+
+  SELECT id INTO job_id
+  FROM ona_jobs
+  WHERE campaign_id = p_campaign_id AND status = 'queued';
+
+  IF job_id IS NULL THEN
+    INSERT INTO ona_jobs (campaign_id) VALUES (p_campaign_id)
+    RETURNING id INTO job_id;
+  END IF;
+  RETURN job_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Oldest queued job, or a running one whose worker went silent for
+-- p_stale_after. SKIP LOCKED lets several workers claim at the same time
+-- without handing out a job twice.
+CREATE OR REPLACE FUNCTION claim_ona_job(
+  p_worker text,
+  p_stale_after interval DEFAULT interval '1 hour',
+  p_max_attempts integer DEFAULT 3
+)
+RETURNS SETOF ona_jobs AS $$
+  UPDATE ona_jobs
+  SET status = 'running',
+      worker = p_worker,
+      attempts = attempts + 1,
+      started_at = now(),
+      finished_at = NULL,
+      result = NULL,
+      error = NULL
+  WHERE id = (
+    SELECT id FROM ona_jobs
+    WHERE (status = 'queued' OR (status = 'running' AND started_at < now() - p_stale_after))
+      AND attempts < p_max_attempts
+    ORDER BY enqueued_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING *;
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION enqueue_ona_job(uuid) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION enqueue_ona_job(uuid) TO authenticated, service_role;
+REVOKE EXECUTE ON FUNCTION claim_ona_job(text, interval, integer) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_ona_job(text, interval, integer) TO service_role;
@@ -0,0 +1,68 @@
+-- Migration: 000024_ona_respondent_vectors_keyset
+-- Keyset pagination for ona_respondent_vectors. Paging the set-returning
+-- function with OFFSET/LIMIT re-ran the whole aggregation for every page;
+-- p_after/p_limit restrict the respondents *before* aggregating, so each
+-- page only reads its own respondents' answers. Rows come back ordered by
+-- respondent_id; pass the last id of a page as p_after for the next one.
+
+DROP FUNCTION IF EXISTS ona_respondent_vectors(uuid, text[]);
+
+CREATE OR REPLACE FUNCTION ona_respondent_vectors(
+  p_campaign_id uuid,
+  p_codes text[],
+  p_after uuid DEFAULT NULL,
+  p_limit integer DEFAULT NULL
+)
+RETURNS TABLE (
+  respondent_id uuid,
+  department text,
+  tenure text,
+  gender text,
+  means float8[]
+) AS $$
+  WITH camp AS (
+    SELECT instrument_id || COALESCE(module_instrument_ids, '{}') AS instrument_ids
+    FROM campaigns
+    WHERE id = p_campaign_id
+  ),
+  completed AS (
+    SELECT id, department, tenure, gender
+    FROM respondents
+    WHERE campaign_id = p_campaign_id
+      AND status = 'completed'
+      AND (p_after IS NULL OR id > p_after)
+    ORDER BY id
+    LIMIT p_limit
+  ),
+  dim_means AS (
+    -- float8 division of exact integer sums matches numpy's mean bit for bit
+    SELECT
+      c.id AS respondent_id,
+      d.code,
+      sum(CASE WHEN i.is_reverse THEN 6 - r.score ELSE r.score END)::float8
+        / count(*) AS mean
+    FROM completed c
+    JOIN responses r ON r.respondent_id = c.id
+    JOIN items i ON i.id = r.item_id AND NOT i.is_attention_check
+    JOIN dimensions d ON d.id = i.dimension_id
+    JOIN camp ON d.instrument_id = ANY (camp.instrument_ids)
+    WHERE r.score IS NOT NULL AND d.code = ANY (p_codes)
+    GROUP BY c.id, d.code
+  )
+  SELECT
+    c.id,
+    c.department,
+    c.tenure,
+    c.gender,
+    array_agg(m.mean ORDER BY k.ord)
+  FROM completed c
+  CROSS JOIN unnest(p_codes) WITH ORDINALITY AS k(code, ord)
+  LEFT JOIN dim_means m ON m.respondent_id = c.id AND m.code = k.code
+  GROUP BY c.id, c.department, c.tenure, c.gender
+  ORDER BY c.id;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+-- Raw per-respondent scores: only the service role (used by the script) may call it
+REVOKE EXECUTE ON FUNCTION ona_respondent_vectors(uuid, text[], uuid, integer)
+  FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ona_respondent_vectors(uuid, text[], uuid, integer) TO service_role;
@@ -0,0 +1,50 @@
+-- Migration: 000025_ona_jobs_heartbeat
+-- Workers stamp heartbeat_at on their running jobs, so a job is reclaimed
+-- once its worker stops beating instead of after a fixed hour (which could
+-- hand a long but healthy job to a second worker). A silent job that has
+-- used up its attempts is marked failed instead of staying running.
+
+ALTER TABLE ona_jobs ADD COLUMN heartbeat_at timestamptz;
+
+CREATE OR REPLACE FUNCTION claim_ona_job(
+  p_worker text,
+  p_stale_after interval DEFAULT interval '1 hour',
+  p_max_attempts integer DEFAULT 3
+)
+RETURNS SETOF ona_jobs AS $$
+BEGIN
+  UPDATE ona_jobs
+  SET status = 'failed',
+      result = 'error',
+      error = format('worker %s stopped responding (attempt %s of %s)',
+                     worker, attempts, p_max_attempts),
+      finished_at = now()
+  WHERE status = 'running'
+    AND coalesce(heartbeat_at, started_at) < now() - p_stale_after
+    AND attempts >= p_max_attempts;
+
+  RETURN QUERY
+  UPDATE ona_jobs
+  SET status = 'running',
+      worker = p_worker,
+      attempts = attempts + 1,
+      started_at = now(),
+      heartbeat_at = now(),
+      finished_at = NULL,
+      result = NULL,
+      error = NULL
+  WHERE id = (
+    SELECT id FROM ona_jobs
+    WHERE (status = 'queued'
+           OR (status = 'running' AND coalesce(heartbeat_at, started_at) < now() - p_stale_after))
+      AND attempts < p_max_attempts
+    ORDER BY enqueued_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING *;
+END;
+$$ LANGUAGE plpgsql VOLATILE SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION claim_ona_job(text, interval, integer) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_ona_job(text, interval, integer) TO service_role;